@@ -0,0 +1,34 @@
+"""Helper bersama untuk script benchmark: memuat bmkg-server.py dan fixture respons BMKG."""
+
+import importlib.util
+import logging
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_PATH = os.path.join(ROOT_DIR, "bmkg-server.py")
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def load_server():
+    """Memuat bmkg-server.py sebagai modul (nama file mengandung tanda hubung)"""
+    # Log request httpx dari FastMCP tidak relevan untuk benchmark
+    logging.disable(logging.INFO)
+    spec = importlib.util.spec_from_file_location("bmkg_server", SERVER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["bmkg_server"] = module
+    spec.loader.exec_module(module)
+    return module
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+        return f.read()
+
+def count_tokens(text: str) -> int:
+    """Jumlah token dengan tiktoken (cl100k_base) bila terpasang, atau perkiraan kasar (byte / 4)"""
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken tidak terpasang atau file encoding tidak bisa diunduh
+        return len(text.encode('utf-8')) // 4
+    return len(encoding.encode(text))
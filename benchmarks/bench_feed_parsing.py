@@ -0,0 +1,85 @@
+"""
+Benchmark parsing feed BMKG: xmltodict + ekstraksi field vs parser streaming (iterparse).
+
+Kedua jalur menghasilkan field yang sama dengan yang dipakai tools, sehingga selisih waktu
+mencerminkan biaya membangun dict bertingkat xmltodict untuk tiap respons.
+
+    python benchmarks/bench_feed_parsing.py
+"""
+
+import time
+import tracemalloc
+
+import xmltodict
+
+from _common import load_server, read_fixture
+
+ITERATIONS = 2000
+
+def xmltodict_gempa(content: bytes) -> list[dict]:
+    """Jalur lama: xmltodict lalu ambil field per gempa"""
+    gempa_list = xmltodict.parse(content)['Infogempa']['gempa']
+    if isinstance(gempa_list, dict):
+        gempa_list = [gempa_list]
+    return [
+        {
+            "tanggal": gempa['Tanggal'],
+            "jam": gempa['Jam'],
+            "magnitude": gempa['Magnitude'],
+            "kedalaman": gempa['Kedalaman'],
+            "lintang": gempa['Lintang'],
+            "bujur": gempa['Bujur'],
+            "wilayah": gempa['Wilayah'],
+            "potensi": gempa.get('Potensi', '-'),
+            "dirasakan": gempa.get('Dirasakan', '-'),
+        }
+        for gempa in gempa_list
+    ]
+
+def xmltodict_nowcast(content: bytes) -> list[dict]:
+    """Jalur lama: xmltodict lalu ambil field per item RSS"""
+    items = xmltodict.parse(content).get('rss', {}).get('channel', {}).get('item', [])
+    if isinstance(items, dict):
+        items = [items]
+    return [
+        {
+            "title": item.get('title', '-'),
+            "link": item.get('link', '-'),
+            "description": item.get('description', '-'),
+            "author": item.get('author', '-'),
+            "pub_date": item.get('pubDate', '-'),
+        }
+        for item in items
+    ]
+
+def measure(parse, content: bytes) -> tuple[float, int]:
+    """Waktu rata-rata per parse (detik) dan puncak alokasi memori satu parse (byte)"""
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        parse(content)
+    elapsed = (time.perf_counter() - start) / ITERATIONS
+
+    tracemalloc.start()
+    parse(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    server = load_server()
+    cases = [
+        ("autogempa.xml", xmltodict_gempa, server.parse_gempa_xml),
+        ("gempaterkini.xml", xmltodict_gempa, server.parse_gempa_xml),
+        ("gempadirasakan.xml", xmltodict_gempa, server.parse_gempa_xml),
+        ("nowcast.xml", xmltodict_nowcast, server.parse_nowcast_xml),
+    ]
+
+    print(f"{'fixture':<20} {'parser':<10} {'us/parse':>10} {'peak KiB':>10}")
+    for name, old_parse, new_parse in cases:
+        content = read_fixture(name)
+        for label, parse in (("xmltodict", old_parse), ("iterparse", new_parse)):
+            elapsed, peak = measure(parse, content)
+            print(f"{name:<20} {label:<10} {elapsed * 1e6:>10.1f} {peak / 1024:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Benchmark ukuran output get_weather_forecast per format (verbose, compact, summary).
+
+Menjalankan tool terhadap fixture prakiraan cuaca (tanpa akses jaringan) lalu melaporkan
+ukuran byte, perkiraan token, dan waktu per panggilan (data sudah di-cache).
+
+    python benchmarks/bench_forecast_format.py
+"""
+
+import asyncio
+import time
+
+import httpx
+
+from _common import count_tokens, load_server, read_fixture
+
+ITERATIONS = 200
+
+async def main():
+    server = load_server()
+    fixture = read_fixture("prakiraan-cuaca.json")
+    server._http_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, content=fixture))
+    )
+
+    print(f"{'format':<10} {'bytes':>8} {'tokens':>8} {'us/call':>10}")
+    for format in server.FORECAST_FORMATS:
+        output = await server.get_weather_forecast("33.02.07.2005", format=format)
+
+        start = time.perf_counter()
+        for _ in range(ITERATIONS):
+            await server.get_weather_forecast("33.02.07.2005", format=format)
+        elapsed = (time.perf_counter() - start) / ITERATIONS
+
+        print(f"{format:<10} {len(output.encode('utf-8')):>8} {count_tokens(output):>8} {elapsed * 1e6:>10.1f}")
+
+    await server._http_client.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
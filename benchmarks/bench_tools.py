@@ -0,0 +1,170 @@
+"""
+Benchmark latensi dan throughput semua tool MCP di bmkg-server.py terhadap server BMKG lokal.
+
+Menjalankan FakeBMKGServer (fixture + latensi buatan), mengarahkan AsyncClient server ke sana,
+lalu memanggil setiap tool pada beberapa tingkat konkurensi. Melaporkan p50/p99 latensi,
+request per detik, jumlah error, dan puncak alokasi memori per tool.
+
+    python benchmarks/bench_tools.py
+    python benchmarks/bench_tools.py --concurrency 1,16,64 --requests 500 --latency-ms 50
+    python benchmarks/bench_tools.py --cold --tools get_weather_forecast,search_location_code
+
+Tanpa --cold, respons BMKG dilayani dari cache (mengukur jalur tool + cache); dengan --cold,
+TTL cache dinolkan sehingga setiap panggilan mengambil ulang dari server lokal.
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from _common import load_server
+from fake_bmkg import FakeBMKGServer, create_client
+
+# Argumen contoh per tool; dipakai bergiliran. Tool baru tanpa entri di sini dilaporkan sebagai dilewati.
+TOOL_CALLS = {
+    "get_latest_earthquake": [{}],
+    "get_significant_earthquakes": [{}, {"min_magnitude": 6.0, "sort": "magnitude"}],
+    "get_felt_earthquakes": [{}, {"lat": -6.2, "lon": 106.8, "radius_km": 1000, "sort": "distance"}],
+    "query_earthquake_history": [{}, {"min_magnitude": 5.5, "sort": "magnitude"}],
+    "search_location_code": [
+        {"location_name": "Sumpiuh"},
+        {"location_name": "kota", "admin_level": "kabkota"},
+        {"location_name": "baroe", "fuzzy": True},
+    ],
+    "get_villages_in_district": [{"district_code": "33.02.07"}],
+    "get_region": [{"code": "33.02.07.2005"}],
+    "list_children": [{"code": "33"}, {"code": "33", "level": "desa", "limit": 100, "cursor": "33.02.07.2005"}],
+    "find_nearest_region": [{"lat": -7.6, "lon": 109.35}],
+    "get_weather_forecast": [
+        {"kode_wilayah": "33.02.07.2005"},
+        {"kode_wilayah": "33.02.07.2005", "format": "compact"},
+    ],
+    "get_weather_forecast_batch": [{"district_code": "33.02.07"}],
+    "get_weather_forecast_stats": [{"kode_wilayah": "33.02.07.2005"}, {"district_code": "33.02.07"}],
+    "get_weather_alerts": [{}],
+    "get_weather_alert_detail": [{"cap_code": "CJK20261017091500"}],
+    "search_weather_alerts_by_kecamatan": [{"kecamatan": "Jagakarsa"}],
+    "get_alerts_for_location": [{"lat": -6.33, "lon": 106.82}],
+    "get_changes_since": [{}],
+}
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+async def run_load(tool, calls: list[dict], concurrency: int, total: int, is_error) -> dict:
+    """
+    Menjalankan `total` panggilan tool dengan `concurrency` worker; mengembalikan statistik latensi.
+    `is_error` adalah is_error_result milik server, sehingga jumlah error sama dengan bmkg_tool_errors_total.
+    """
+    latencies = []
+    errors = 0
+    next_call = 0
+
+    async def worker():
+        nonlocal next_call, errors
+        while next_call < total:
+            kwargs = calls[next_call % len(calls)]
+            next_call += 1
+            start = time.perf_counter()
+            try:
+                output = await tool(**kwargs)
+                if is_error(output):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "mean": statistics.fmean(latencies),
+        "rps": total / elapsed,
+        "errors": errors,
+    }
+
+async def measure_peak_memory(tool, calls: list[dict], concurrency: int) -> int:
+    """Puncak alokasi Python (tracemalloc) selama satu putaran kecil panggilan bersamaan"""
+    tracemalloc.start()
+    await asyncio.gather(*(tool(**calls[i % len(calls)]) for i in range(concurrency)))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def disable_cache(server):
+    """Setiap panggilan menjadi cache miss (single-flight tetap aktif untuk request bersamaan)"""
+    for endpoint in server.CACHE_TTLS:
+        server.CACHE_TTLS[endpoint] = 0
+    server.CACHE_TTL_FUNCS.clear()
+    server.CACHE_STALE_WINDOW = 0
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark tools bmkg-server.py terhadap server BMKG lokal")
+    parser.add_argument("--concurrency", default="1,8,32", help="Daftar tingkat konkurensi, dipisah koma")
+    parser.add_argument("--requests", type=int, default=200, help="Jumlah panggilan per tool per tingkat konkurensi")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Latensi buatan server lokal per request")
+    parser.add_argument("--cold", action="store_true", help="Nonaktifkan cache respons (ukur jalur fetch)")
+    parser.add_argument("--tools", default="", help="Hanya tool ini (dipisah koma)")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    # Riwayat gempa dan centroid benchmark tidak boleh tercampur dengan data lokal pengguna
+    workdir = tempfile.mkdtemp(prefix="bmkg-bench-")
+    os.environ["BMKG_HISTORY_PATH"] = os.path.join(workdir, "history.sqlite3")
+    os.environ["BMKG_CENTROIDS_PATH"] = os.path.join(workdir, "centroids.csv")
+    server = load_server()
+
+    fake = FakeBMKGServer(latency=args.latency_ms / 1000)
+    await fake.start()
+    server._http_client = create_client(server, fake.port)
+    if args.cold:
+        disable_cache(server)
+
+    registered = [tool.name for tool in await server.mcp.list_tools()]
+    selected = [name for name in registered if not args.tools or name in args.tools.split(",")]
+    skipped = [name for name in selected if name not in TOOL_CALLS]
+
+    # Pemanasan: memuat indeks wilayah, mengisi cache, centroid, dan riwayat
+    for name in selected:
+        for kwargs in TOOL_CALLS.get(name, []):
+            await getattr(server, name)(**kwargs)
+
+    mode = "cold (tanpa cache)" if args.cold else "cache"
+    print(f"Fake BMKG 127.0.0.1:{fake.port}, latensi {args.latency_ms} ms, mode {mode}, {args.requests} panggilan/baris")
+    print(f"{'tool':<36} {'conc':>5} {'p50 ms':>9} {'p99 ms':>9} {'rps':>9} {'err':>5} {'peak KiB':>9}")
+    for name in selected:
+        if name in skipped:
+            continue
+        tool = getattr(server, name)
+        calls = TOOL_CALLS[name]
+        for concurrency in levels:
+            stats = await run_load(tool, calls, concurrency, args.requests, server.is_error_result)
+            peak = await measure_peak_memory(tool, calls, concurrency)
+            print(
+                f"{name:<36} {concurrency:>5} {stats['p50'] * 1e3:>9.2f} {stats['p99'] * 1e3:>9.2f} "
+                f"{stats['rps']:>9.1f} {stats['errors']:>5} {peak / 1024:>9.1f}"
+            )
+
+    # ru_maxrss dalam KiB di Linux, byte di macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        max_rss //= 1024
+    print(f"\nRequest ke server lokal: {fake.requests}, max RSS proses: {max_rss / 1024:.1f} MiB")
+    if skipped:
+        print(f"Dilewati (belum ada argumen contoh di TOOL_CALLS): {', '.join(skipped)}")
+
+    await server._http_client.aclose()
+    await fake.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
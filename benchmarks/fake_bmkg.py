@@ -0,0 +1,143 @@
+"""
+Server HTTP lokal pengganti BMKG untuk benchmark tanpa akses jaringan.
+
+Melayani fixture di `benchmarks/fixtures/` pada path yang sama dengan server BMKG asli
+(TEWS, prakiraan cuaca, RSS nowcast, dan dokumen CAP), dengan latensi buatan per request.
+Dapat dijalankan sendiri untuk pengujian manual:
+
+    python benchmarks/fake_bmkg.py --port 8099 --latency-ms 50
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+from _common import read_fixture
+
+# Host BMKG yang dialihkan ke server lokal oleh RewriteTransport
+BMKG_HOSTS = ("data.bmkg.go.id", "api.bmkg.go.id", "www.bmkg.go.id")
+
+class FakeBMKGServer:
+    """Server HTTP/1.1 minimal (keep-alive) di atas asyncio.start_server"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.requests = 0
+        self.server: asyncio.Server | None = None
+        self.fixtures = {
+            "/DataMKG/TEWS/autogempa.xml": read_fixture("autogempa.xml"),
+            "/DataMKG/TEWS/gempaterkini.xml": read_fixture("gempaterkini.xml"),
+            "/DataMKG/TEWS/gempadirasakan.xml": read_fixture("gempadirasakan.xml"),
+            "/alerts/nowcast/id": read_fixture("nowcast.xml"),
+            "/alerts/nowcast/en": read_fixture("nowcast.xml"),
+        }
+        self.cap_alert = read_fixture("cap_alert.xml")
+        self.forecast = json.loads(read_fixture("prakiraan-cuaca.json"))
+        self.forecasts: dict[str, bytes] = {}
+
+    def forecast_for(self, adm4: str) -> bytes:
+        """Fixture prakiraan cuaca dengan field lokasi disesuaikan ke kode adm4 yang diminta"""
+        body = self.forecasts.get(adm4)
+        if body is None:
+            data = copy.deepcopy(self.forecast)
+            parts = adm4.split('.')
+            data['lokasi'].update({f"adm{i}": '.'.join(parts[:i]) for i in range(1, 5)})
+            body = self.forecasts[adm4] = json.dumps(data).encode()
+        return body
+
+    def route(self, target: str) -> tuple[int, bytes, str]:
+        url = urlsplit(target)
+        if url.path in self.fixtures:
+            return 200, self.fixtures[url.path], "application/xml"
+        if url.path == "/publik/prakiraan-cuaca":
+            adm4 = parse_qs(url.query).get("adm4", [""])[0]
+            if adm4.count('.') == 3:
+                return 200, self.forecast_for(adm4), "application/json"
+        if url.path.startswith("/alerts/nowcast/") and url.path.endswith("_alert.xml"):
+            return 200, self.cap_alert, "application/xml"
+        return 404, b"Not Found", "text/plain"
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                _, target, _ = request_line.decode("latin-1").split(" ", 2)
+                status, body, content_type = self.route(target)
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    "Connection: keep-alive\r\n\r\n".encode("latin-1") + body
+                )
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+class RewriteTransport(httpx.AsyncBaseTransport):
+    """Transport httpx yang mengalihkan request ke host BMKG menuju FakeBMKGServer"""
+
+    def __init__(self, port: int, **kwargs):
+        self.port = port
+        self.inner = httpx.AsyncHTTPTransport(**kwargs)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host in BMKG_HOSTS:
+            request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self.port)
+            request.headers["Host"] = f"127.0.0.1:{self.port}"
+        return await self.inner.handle_async_request(request)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+def create_client(server, port: int) -> httpx.AsyncClient:
+    """AsyncClient dengan pengaturan pool yang sama seperti bmkg-server.py, diarahkan ke server lokal"""
+    return httpx.AsyncClient(
+        transport=RewriteTransport(
+            port,
+            limits=httpx.Limits(
+                max_connections=server.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=server.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=server.HTTP_KEEPALIVE_EXPIRY
+            )
+        ),
+        timeout=httpx.Timeout(server.HTTP_TIMEOUT, connect=server.HTTP_CONNECT_TIMEOUT)
+    )
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeBMKGServer(port=args.port, latency=args.latency_ms / 1000)
+    await fake.start()
+    print(f"Fake BMKG berjalan di http://127.0.0.1:{fake.port} (latensi {args.latency_ms} ms)")
+    await fake.server.serve_forever()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,9 +1,107 @@
 import httpx
+import importlib.util
 import xmltodict
 import json
+import io
+import xml.etree.ElementTree as ET
 import csv
 import os
+import time
+import asyncio
+import bisect
+import contextvars
+import functools
+from datetime import datetime, timezone
+import re
+import math
+import sys
+import hashlib
+import marshal
+import sqlite3
+import threading
+import heapq
+import random
+import signal
+import socket
+import traceback
+from array import array
+from itertools import islice
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
 from mcp.server.fastmcp import FastMCP
+from starlette.responses import PlainTextResponse
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: lock antar proses tidak tersedia, mode multi-worker juga tidak didukung
+    fcntl = None
+
+# Konfigurasi koneksi HTTP ke server BMKG (dapat diatur lewat environment variable)
+HTTP_TIMEOUT = float(os.environ.get("BMKG_HTTP_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("BMKG_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("BMKG_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("BMKG_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("BMKG_HTTP_KEEPALIVE_EXPIRY", "60"))
+# HTTP/2 membutuhkan paket h2 (httpx[http2]); tanpa itu otomatis kembali ke HTTP/1.1
+HTTP2_ENABLED = os.environ.get("BMKG_HTTP2", "1") != "0" and importlib.util.find_spec("h2") is not None
+
+_http_client: httpx.AsyncClient | None = None
+
+# Job background (coroutine tanpa argumen) yang berjalan selama server hidup, lihat lifespan()
+BACKGROUND_JOBS = []
+_background_tasks: list = []
+_lifespan_users = 0
+
+def create_http_client() -> httpx.AsyncClient:
+    """Membuat AsyncClient dengan connection pool dan keep-alive untuk semua host BMKG"""
+    return httpx.AsyncClient(
+        http2=HTTP2_ENABLED,
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Mengembalikan AsyncClient bersama milik proses ini sehingga koneksi (DNS, TCP, TLS)
+    ke data.bmkg.go.id, api.bmkg.go.id, dan www.bmkg.go.id dipakai ulang antar pemanggilan tool.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client()
+    return _http_client
+
+@asynccontextmanager
+async def lifespan(server):
+    """
+    Lifespan FastMCP: menyiapkan AsyncClient bersama dan job background, lalu menutupnya
+    saat server berhenti. Pada transport HTTP lifespan berjalan per sesi, jadi semuanya
+    dimulai pada sesi pertama dan ditutup saat sesi terakhir selesai.
+    """
+    global _http_client, _lifespan_users
+    get_http_client()
+    _lifespan_users += 1
+    if _lifespan_users == 1:
+        _background_tasks.extend(asyncio.create_task(job()) for job in BACKGROUND_JOBS)
+    try:
+        yield {}
+    finally:
+        _lifespan_users -= 1
+        if _lifespan_users == 0:
+            for task in _background_tasks:
+                task.cancel()
+            await asyncio.gather(*_background_tasks, return_exceptions=True)
+            _background_tasks.clear()
+            # Centroid yang belum sempat ditulis ke centroids.csv
+            centroid_index.flush()
+            if _http_client is not None:
+                await _http_client.aclose()
+                _http_client = None
 
 mcp = FastMCP(
     "Unofficial BMKG",
@@ -16,12 +114,1146 @@ mcp = FastMCP(
     Sumber Data: BMKG (Badan Meteorologi, Klimatologi, dan Geofisika)
     Website: https://www.bmkg.go.id
     Data API: https://data.bmkg.go.id
-    """
+    """,
+    lifespan=lifespan
 )
 
 BMKG_ATTRIBUTION = "Sumber: BMKG (Badan Meteorologi, Klimatologi, dan Geofisika) - https://www.bmkg.go.id"
 
+# ---------------------------------------------------------------------------
+# Metrics: timing span per tahap dan counter, diekspos dalam format teks Prometheus
+# ---------------------------------------------------------------------------
+
+METRICS_ENABLED = os.environ.get("BMKG_METRICS", "1") != "0"
+# Batas atas bucket histogram durasi span (detik)
+SPAN_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    "bmkg_tool_calls_total": "Jumlah pemanggilan tool",
+    "bmkg_tool_errors_total": "Jumlah pemanggilan tool yang gagal (exception, pesan Gagal/Error, atau JSON berkunci error)",
+    "bmkg_tool_response_bytes_total": "Total byte output tool",
+    "bmkg_upstream_requests_total": "Request ke server BMKG per endpoint dan status HTTP",
+    "bmkg_upstream_errors_total": "Request ke server BMKG yang gagal (error koneksi atau status 4xx/5xx)",
+    "bmkg_upstream_bytes_total": "Total byte respons dari server BMKG",
+    "bmkg_upstream_retries_total": "Request ke server BMKG yang dicoba ulang (error koneksi, timeout, 5xx/429)",
+    "bmkg_circuit_open_total": "Berapa kali circuit breaker host BMKG terbuka",
+    "bmkg_stale_fallback_total": "Tool yang dilayani data terakhir dari cache karena server BMKG gagal",
+    "bmkg_background_job_errors_total": "Iterasi job background yang gagal (upstream: BMKG/cache bersama, internal: bug)",
+}
+
+# Tool yang sedang berjalan, dipakai sebagai label span fetch/parse/search/serialize di dalamnya
+current_tool: contextvars.ContextVar[str] = contextvars.ContextVar("current_tool", default="-")
+# Data terakhir dari cache yang dipakai tool karena server BMKG gagal: [(endpoint, usia detik, error)]
+upstream_fallbacks: contextvars.ContextVar[list | None] = contextvars.ContextVar("upstream_fallbacks", default=None)
+
+class Metrics:
+    """Counter dan histogram durasi span di memori proses"""
+
+    def __init__(self):
+        self.counters: dict[tuple[str, tuple], float] = {}
+        # (stage, tool) -> [jumlah per bucket (termasuk +Inf)..., total durasi]
+        self.spans: dict[tuple[str, str], list] = {}
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        if not METRICS_ENABLED:
+            return
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, stage: str, seconds: float):
+        key = (stage, current_tool.get())
+        histogram = self.spans.get(key)
+        if histogram is None:
+            histogram = self.spans[key] = [0] * (len(SPAN_BUCKETS) + 1) + [0.0]
+        histogram[bisect.bisect_left(SPAN_BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+    @staticmethod
+    def _labels(labels) -> str:
+        return ",".join(f'{key}="{value}"' for key, value in labels)
+
+    def render(self, cache_stats: dict[str, Counter]) -> str:
+        """Teks eksposisi Prometheus (text/plain; version=0.0.4)"""
+        lines = []
+        by_name: dict[str, list] = {}
+        for (name, labels), value in sorted(self.counters.items()):
+            by_name.setdefault(name, []).append((labels, value))
+        for name, samples in by_name.items():
+            lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{{{self._labels(labels)}}} {value:g}" for labels, value in samples)
+
+        lines.append("# HELP bmkg_cache_events_total Event cache respons BMKG (hit, stale, miss, coalesced, not_modified, fallback)")
+        lines.append("# TYPE bmkg_cache_events_total counter")
+        for endpoint, counter in sorted(cache_stats.items()):
+            for event, value in sorted(counter.items()):
+                lines.append(f'bmkg_cache_events_total{{endpoint="{endpoint}",event="{event}"}} {value}')
+
+        lines.append("# HELP bmkg_span_seconds Durasi tahap (tool, fetch, parse, index_load, search, serialize) per tool")
+        lines.append("# TYPE bmkg_span_seconds histogram")
+        for (stage, tool), histogram in sorted(self.spans.items()):
+            labels = f'stage="{stage}",tool="{tool}"'
+            cumulative = 0
+            for bound, count in zip((*SPAN_BUCKETS, "+Inf"), histogram):
+                cumulative += count
+                lines.append(f'bmkg_span_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"bmkg_span_seconds_sum{{{labels}}} {histogram[-1]:.6f}")
+            lines.append(f"bmkg_span_seconds_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        metrics.observe(self.stage, time.perf_counter() - self.start)
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+def span(stage: str):
+    """Context manager pengukur durasi satu tahap; tanpa biaya berarti bila metrics dinonaktifkan"""
+    return _Span(stage) if METRICS_ENABLED else _NOOP_SPAN
+
+def mark_stale(result: str, fallbacks: list[tuple[str, float, str]]) -> str:
+    """Menyisipkan field "stale" di awal objek JSON output tool yang memakai data terakhir dari cache"""
+    if not result.startswith("{"):
+        return result
+    sources = {}
+    for endpoint, age, error in fallbacks:
+        if endpoint not in sources or age > sources[endpoint]["age_seconds"]:
+            sources[endpoint] = {"endpoint": endpoint, "age_seconds": round(age), "error": error}
+    stale = {
+        "message": "Server BMKG tidak dapat dihubungi; data berikut adalah data terakhir yang berhasil diambil",
+        "sources": list(sources.values())
+    }
+    rest = result[1:]
+    if rest.lstrip().startswith("}"):
+        return json.dumps({"stale": stale}, ensure_ascii=False)
+    # Pertahankan gaya output tool (indent=2 atau ringkas)
+    if rest.startswith("\n"):
+        stale_json = json.dumps(stale, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+        return f'{{\n  "stale": {stale_json},{rest}'
+    return f'{{"stale": {json.dumps(stale, ensure_ascii=False)},{rest}'
+
+def is_error_result(result: str) -> bool:
+    """
+    Tools mengembalikan pesan teks bila gagal, atau JSON dengan kunci "error" sebagai kunci
+    pertama di tingkat atas (mis. kode wilayah atau cursor tidak valid)
+    """
+    if not result.startswith("{"):
+        return True
+    return result[1:].lstrip().startswith('"error"')
+
+def instrumented(func):
+    """
+    Dekorator tool: span "tool", jumlah panggilan, error, dan byte output per tool, serta
+    penanda "stale" bila tool memakai data terakhir dari cache karena server BMKG gagal.
+    """
+    name = func.__name__
+    labels = (("tool", name),)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        tool_token = current_tool.set(name)
+        fallbacks = []
+        fallback_token = upstream_fallbacks.set(fallbacks)
+        metrics.inc("bmkg_tool_calls_total", labels)
+        try:
+            with span("tool"):
+                result = await func(*args, **kwargs)
+        except BaseException:
+            metrics.inc("bmkg_tool_errors_total", labels)
+            raise
+        finally:
+            upstream_fallbacks.reset(fallback_token)
+            current_tool.reset(tool_token)
+        if METRICS_ENABLED and is_error_result(result):
+            metrics.inc("bmkg_tool_errors_total", labels)
+        if fallbacks:
+            metrics.inc("bmkg_stale_fallback_total", labels)
+            result = mark_stale(result, fallbacks)
+        if METRICS_ENABLED:
+            metrics.inc("bmkg_tool_response_bytes_total", labels, len(result.encode('utf-8')))
+        return result
+
+    return wrapper
+
+def dump_json(data, **kwargs) -> str:
+    """json.dumps dengan span "serialize" untuk metrics"""
+    with span("serialize"):
+        return json.dumps(data, **kwargs)
+
+# ---------------------------------------------------------------------------
+# Cache respons BMKG
+# ---------------------------------------------------------------------------
+
+# TTL cache per endpoint (detik). Feed TEWS dan nowcast hanya berubah tiap beberapa menit.
+CACHE_TTLS = {
+    "autogempa": 60,
+    "gempaterkini": 120,
+    "gempadirasakan": 120,
+    "nowcast": 120,
+    "cap": 300,
+    "prakiraan-cuaca": 900,
+}
+# Setelah TTL habis, data lama masih dikembalikan selama jendela ini sambil diperbarui di background
+CACHE_STALE_WINDOW = float(os.environ.get("BMKG_CACHE_STALE_WINDOW", "300"))
+# TTL maksimal dokumen CAP yang di-cache hingga waktu `expires`-nya
+CAP_MAX_TTL = 6 * 3600
+CACHE_MAX_ENTRIES = int(os.environ.get("BMKG_CACHE_MAX_ENTRIES", "1024"))
+# Bila server BMKG gagal, data terakhir yang berhasil diambil tetap dikembalikan (ditandai "stale") hingga usia ini
+LAST_GOOD_MAX_AGE = float(os.environ.get("BMKG_LAST_GOOD_MAX_AGE", "86400"))
+
+class CacheEntry:
+    """Satu respons BMKG yang sudah di-parse beserta validator HTTP-nya"""
+
+    __slots__ = ("value", "expires_at", "etag", "last_modified", "fetched_at")
+
+    def __init__(self, value, expires_at: float, etag: str | None, last_modified: str | None):
+        self.value = value
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+        # Terakhir kali server BMKG mengonfirmasi data ini (200 atau 304)
+        self.fetched_at = time.monotonic()
+
+class ResponseCache:
+    """
+    Cache LRU ber-TTL untuk respons BMKG yang sudah di-parse, dengan stale-while-revalidate
+    dan conditional request (ETag/If-Modified-Since). Menyimpan statistik hit/miss per endpoint.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.stats: dict[str, Counter] = {}
+        # Request upstream yang sedang berjalan per URL (single-flight)
+        self.inflight: dict[str, asyncio.Task] = {}
+
+    def count(self, endpoint: str, event: str):
+        self.stats.setdefault(endpoint, Counter())[event] += 1
+
+    def get(self, key: str) -> CacheEntry | None:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CacheEntry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.stats.clear()
+
+    def snapshot_stats(self) -> dict:
+        result = {}
+        for endpoint, counter in sorted(self.stats.items()):
+            lookups = counter["hit"] + counter["stale"] + counter["miss"]
+            result[endpoint] = {
+                **counter,
+                "hit_ratio": round((counter["hit"] + counter["stale"]) / lookups, 3) if lookups else None
+            }
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttls": CACHE_TTLS,
+            "stale_window": CACHE_STALE_WINDOW,
+            "endpoints": result
+        }
+
+response_cache = ResponseCache()
+
+def cap_cache_ttl(data) -> float:
+    """TTL dokumen CAP: berlaku hingga waktu `expires` peringatan (minimal TTL default endpoint cap)"""
+    info = data.get('alert', {}).get('info', {})
+    if isinstance(info, list):
+        info = info[0] if info else {}
+    try:
+        expires = datetime.fromisoformat(info.get('expires', ''))
+    except (TypeError, ValueError):
+        return CACHE_TTLS["cap"]
+    if expires.tzinfo is None:
+        expires = expires.replace(tzinfo=timezone.utc)
+    remaining = (expires - datetime.now(timezone.utc)).total_seconds()
+    return min(max(remaining, CACHE_TTLS["cap"]), CAP_MAX_TTL)
+
+# Endpoint dengan TTL yang ditentukan dari isi respons
+CACHE_TTL_FUNCS = {
+    "cap": cap_cache_ttl,
+}
+
+# Coroutine (endpoint -> fungsi(value)) yang dipanggil setiap respons baru selesai di-parse, lihat history_store
+RESPONSE_HOOKS = {}
+
+def parse_xml(content: bytes):
+    return xmltodict.parse(content)
+
+def parse_json(content: bytes):
+    return json.loads(content)
+
+# ---------------------------------------------------------------------------
+# Fetch upstream: timeout per request, retry ber-jitter, dan circuit breaker per host
+# ---------------------------------------------------------------------------
+
+# Jumlah retry untuk error koneksi/timeout dan status 5xx/429, dengan backoff eksponensial berjitter penuh
+FETCH_RETRIES = int(os.environ.get("BMKG_FETCH_RETRIES", "2"))
+FETCH_RETRY_BACKOFF = float(os.environ.get("BMKG_FETCH_RETRY_BACKOFF", "0.25"))
+# Batas total waktu satu fetch termasuk semua retry (detik)
+FETCH_DEADLINE = float(os.environ.get("BMKG_FETCH_DEADLINE", "15"))
+# Circuit breaker terbuka setelah sekian kegagalan berturut-turut, lalu gagal cepat selama cooldown (detik)
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BMKG_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("BMKG_BREAKER_COOLDOWN", "30"))
+
+class UpstreamUnavailableError(httpx.TransportError):
+    """Request tidak dikirim karena circuit breaker host BMKG sedang terbuka"""
+
+def is_retryable_status(status_code: int) -> bool:
+    return status_code >= 500 or status_code == 429
+
+def is_upstream_failure(exc: Exception) -> bool:
+    """Kegagalan server BMKG (bukan kesalahan input seperti 404) yang boleh dilayani data terakhir"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return is_retryable_status(exc.response.status_code)
+    return isinstance(exc, httpx.TransportError)
+
+class CircuitBreaker:
+    """
+    Circuit breaker satu host BMKG.
+
+    - closed: request dikirim seperti biasa.
+    - open: setelah BREAKER_FAILURE_THRESHOLD fetch gagal berturut-turut (satu fetch dihitung sekali,
+      setelah semua retry-nya habis); request langsung gagal
+      dengan UpstreamUnavailableError selama BREAKER_COOLDOWN.
+    - half_open: setelah cooldown, satu request percobaan dikirim (request lain tetap gagal cepat);
+      berhasil menutup breaker, gagal membukanya lagi.
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def before_request(self):
+        if self.state == "closed":
+            return
+        if self.state == "open":
+            remaining = self.opened_at + BREAKER_COOLDOWN - time.monotonic()
+            if remaining > 0:
+                raise UpstreamUnavailableError(
+                    f"Server {self.host} sedang tidak dapat dihubungi, coba lagi dalam {math.ceil(remaining)} detik"
+                )
+            self.state = "half_open"
+            self.probing = False
+        if self.probing:
+            raise UpstreamUnavailableError(f"Server {self.host} sedang tidak dapat dihubungi, koneksi sedang diuji ulang")
+        self.probing = True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= BREAKER_FAILURE_THRESHOLD:
+            if self.state != "open":
+                metrics.inc("bmkg_circuit_open_total", (("host", self.host),))
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Request percobaan dibatalkan tanpa hasil; request berikutnya boleh mencoba lagi"""
+        self.probing = False
+
+    def snapshot(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+circuit_breakers: dict[str, CircuitBreaker] = {}
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    breaker = circuit_breakers.get(host)
+    if breaker is None:
+        breaker = circuit_breakers[host] = CircuitBreaker(host)
+    return breaker
+
+async def fetch_upstream(url: str, endpoint: str, headers: dict) -> httpx.Response:
+    """
+    GET ke server BMKG melalui circuit breaker host, dengan retry ber-jitter dalam FETCH_DEADLINE.
+
+    Error koneksi/timeout dan status 5xx/429 dicoba ulang hingga FETCH_RETRIES kali; respons lain
+    (termasuk 304 dan 4xx) langsung dikembalikan. Bila retry habis, respons 5xx terakhir dikembalikan
+    atau error koneksi terakhir di-raise. Raise UpstreamUnavailableError bila breaker terbuka.
+
+    Breaker diperiksa sekali per fetch dan mencatat satu kegagalan setelah retry habis, sehingga
+    BREAKER_FAILURE_THRESHOLD berarti jumlah fetch gagal, bukan jumlah percobaan.
+    """
+    breaker = get_circuit_breaker(httpx.URL(url).host)
+    endpoint_label = (("endpoint", endpoint),)
+    deadline = time.monotonic() + FETCH_DEADLINE
+    attempt = 0
+    breaker.before_request()
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            timeout = httpx.Timeout(min(HTTP_TIMEOUT, remaining), connect=min(HTTP_CONNECT_TIMEOUT, remaining))
+            response = error = None
+            try:
+                with span("fetch"):
+                    response = await get_http_client().get(url, headers=headers, timeout=timeout)
+            except httpx.TransportError as e:
+                metrics.inc("bmkg_upstream_errors_total", endpoint_label)
+                error = e
+            else:
+                metrics.inc("bmkg_upstream_requests_total", (*endpoint_label, ("status", str(response.status_code))))
+                metrics.inc("bmkg_upstream_bytes_total", endpoint_label, len(response.content))
+                if response.status_code >= 400:
+                    metrics.inc("bmkg_upstream_errors_total", endpoint_label)
+                if not is_retryable_status(response.status_code):
+                    breaker.record_success()
+                    return response
+
+            backoff = random.uniform(0, FETCH_RETRY_BACKOFF * 2 ** attempt)
+            if attempt >= FETCH_RETRIES or time.monotonic() + backoff >= deadline:
+                break
+            attempt += 1
+            metrics.inc("bmkg_upstream_retries_total", endpoint_label)
+            await asyncio.sleep(backoff)
+    except BaseException:
+        breaker.release()
+        raise
+
+    breaker.record_failure()
+    if response is not None:
+        return response
+    raise error
+
+# ---------------------------------------------------------------------------
+# Cache bersama antar worker (mode multi-worker, lihat serve_workers)
+# ---------------------------------------------------------------------------
+
+# SQLite (WAL) berisi respons mentah BMKG yang dipakai bersama oleh semua worker; kosong = nonaktif
+SHARED_CACHE_PATH = os.environ.get("BMKG_SHARED_CACHE_PATH", "")
+# Interval pengecekan ulang saat menunggu worker lain yang sedang mengambil URL yang sama (detik)
+SHARED_CACHE_POLL_INTERVAL = 0.05
+
+SHARED_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    content BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    url TEXT PRIMARY KEY,
+    owner INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS change_events (
+    cursor INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS change_feeds (
+    feed TEXT PRIMARY KEY,
+    snapshot TEXT,
+    error TEXT,
+    fetched_at REAL,
+    polled_at REAL NOT NULL
+);
+"""
+
+class SharedCache:
+    """
+    Respons mentah BMKG di SQLite yang dipakai bersama oleh beberapa proses worker, plus lease
+    per URL sehingga hanya satu worker yang mengambil URL dari BMKG pada satu waktu. Log
+    perubahan feed (get_changes_since) juga disimpan di sini agar cursor-nya global.
+    Waktu disimpan sebagai epoch (time.time()) karena clock monotonic tidak sama antar proses.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection: sqlite3.Connection | None = None
+        # Koneksi dipakai dari thread pool asyncio.to_thread, akses diserialkan
+        self.lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            connection = sqlite3.connect(self.path, timeout=FETCH_DEADLINE, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SHARED_CACHE_SCHEMA)
+            self.connection = connection
+        return self.connection
+
+    def get(self, url: str) -> tuple | None:
+        """(content, etag, last_modified, fetched_at, expires_at) atau None"""
+        with self.lock:
+            return self.connect().execute(
+                "SELECT content, etag, last_modified, fetched_at, expires_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+
+    def put(self, url: str, content: bytes, etag: str | None, last_modified: str | None, fetched_at: float, expires_at: float):
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                    (url, content, etag, last_modified, fetched_at, expires_at)
+                )
+
+    def touch(self, url: str, fetched_at: float, expires_at: float):
+        """Respons 304: data tidak berubah, hanya waktu berlakunya diperpanjang"""
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute(
+                    "UPDATE responses SET fetched_at = ?, expires_at = ? WHERE url = ?", (fetched_at, expires_at, url)
+                )
+
+    def acquire(self, url: str, duration: float) -> bool:
+        """Mengambil lease fetch untuk URL; False bila worker lain memegang lease yang belum berakhir"""
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                cursor = connection.execute(
+                    "INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT (url) DO UPDATE SET "
+                    "owner = excluded.owner, expires_at = excluded.expires_at WHERE leases.expires_at < ?",
+                    (url, os.getpid(), now + duration, now)
+                )
+                return cursor.rowcount == 1
+
+    def release(self, url: str):
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute("DELETE FROM leases WHERE url = ? AND owner = ?", (url, os.getpid()))
+
+    def changes_after(self, cursor: int) -> tuple[list[tuple], list[tuple]]:
+        """Event perubahan dengan cursor > `cursor` dan status per feed (feed, error, polled_at)"""
+        with self.lock:
+            connection = self.connect()
+            events = connection.execute(
+                "SELECT cursor, event FROM change_events WHERE cursor > ? ORDER BY cursor", (cursor,)
+            ).fetchall()
+            feeds = connection.execute("SELECT feed, error, polled_at FROM change_feeds").fetchall()
+            return events, feeds
+
+    def feed_snapshots(self) -> dict[str, tuple]:
+        """Snapshot terakhir per feed: feed -> (snapshot JSON, waktu data diambil)"""
+        with self.lock:
+            rows = self.connect().execute("SELECT feed, snapshot, fetched_at FROM change_feeds").fetchall()
+            return {feed: (snapshot, fetched_at) for feed, snapshot, fetched_at in rows}
+
+    def save_changes(self, feeds: list[tuple], events: list[str], max_events: int):
+        """
+        Menyimpan hasil satu poll dalam satu transaksi: baris (feed, snapshot, error, fetched_at,
+        polled_at) per feed dan event baru. Snapshot/fetched_at None mempertahankan nilai lama.
+        """
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.executemany(
+                    "INSERT INTO change_feeds VALUES (?, ?, ?, ?, ?) ON CONFLICT (feed) DO UPDATE SET "
+                    "snapshot = coalesce(excluded.snapshot, snapshot), error = excluded.error, "
+                    "fetched_at = coalesce(excluded.fetched_at, fetched_at), polled_at = excluded.polled_at",
+                    feeds
+                )
+                connection.executemany("INSERT INTO change_events (event) VALUES (?)", [(event,) for event in events])
+                connection.execute(
+                    "DELETE FROM change_events WHERE cursor <= (SELECT MAX(cursor) FROM change_events) - ?",
+                    (max_events,)
+                )
+
+shared_cache = SharedCache(SHARED_CACHE_PATH) if SHARED_CACHE_PATH else None
+
+async def claim_job(name: str, interval: float) -> bool:
+    """
+    Setiap worker menjalankan job background, tetapi dengan cache bersama hanya worker yang
+    mendapat lease "job:<nama>" selama satu interval yang menjalankan iterasi tersebut
+    """
+    if shared_cache is None:
+        return True
+    return await asyncio.to_thread(shared_cache.acquire, f"job:{name}", interval)
+
+async def run_background_job(name: str, interval: float, work):
+    """
+    Loop job background: menjalankan work() setiap `interval` detik (lihat claim_job). Kegagalan
+    BMKG atau cache bersama hanya dihitung; error lain (bug) juga dicetak ke stderr, dan loop
+    tetap berjalan pada iterasi berikutnya.
+    """
+    while True:
+        try:
+            if await claim_job(name, interval):
+                await work()
+        except (httpx.HTTPError, sqlite3.Error):
+            metrics.inc("bmkg_background_job_errors_total", (("job", name), ("kind", "upstream")))
+        except Exception:
+            metrics.inc("bmkg_background_job_errors_total", (("job", name), ("kind", "internal")))
+            print(f"Job background {name} gagal:", file=sys.stderr)
+            traceback.print_exc()
+        await asyncio.sleep(interval)
+
+def monotonic_offset() -> float:
+    """Selisih clock monotonic proses ini terhadap epoch, untuk konversi waktu cache bersama"""
+    return time.monotonic() - time.time()
+
+async def _read_shared(url: str, parse, endpoint: str, entry: CacheEntry | None, ahead: float = 0) -> tuple:
+    """
+    Memeriksa cache bersama sebelum request ke BMKG. Mengembalikan (value, entry, lease):
+
+    - value: hasil parse respons dari worker lain yang masih berlaku setidaknya `ahead` detik
+      lagi (tanpa request), atau None.
+    - entry: entry terbaru (lokal atau dari cache bersama) untuk conditional request dan fallback.
+    - lease: True bila worker ini memegang lease dan harus melepasnya setelah fetch.
+
+    Bila worker lain sedang mengambil URL yang sama, hasilnya ditunggu hingga lease berakhir.
+    """
+    seen = entry.fetched_at - monotonic_offset() if entry is not None else 0.0
+    deadline = time.monotonic() + FETCH_DEADLINE
+    waited = False
+    while True:
+        row = await asyncio.to_thread(shared_cache.get, url)
+        # Toleransi 1 ms: konversi clock membuat entry milik worker ini sedikit berbeda dari barisnya
+        if row is not None and row[3] > seen + 0.001:
+            content, etag, last_modified, fetched_at, expires_at = row
+            seen = fetched_at
+            with span("parse"):
+                value = parse(content)
+            offset = monotonic_offset()
+            entry = CacheEntry(value, expires_at + offset, etag, last_modified)
+            entry.fetched_at = fetched_at + offset
+            if time.monotonic() + ahead < entry.expires_at:
+                response_cache.count(endpoint, "shared_hit")
+                response_cache.put(url, entry)
+                return value, entry, False
+        if await asyncio.to_thread(shared_cache.acquire, url, FETCH_DEADLINE):
+            return None, entry, True
+        if time.monotonic() >= deadline:
+            # Pemegang lease tidak selesai tepat waktu: ambil sendiri
+            return None, entry, False
+        if not waited:
+            response_cache.count(endpoint, "shared_wait")
+            waited = True
+        await asyncio.sleep(SHARED_CACHE_POLL_INTERVAL)
+
+async def _fetch_and_store(url: str, parse, endpoint: str, entry: CacheEntry | None, ahead: float = 0):
+    """
+    Mengambil URL dari BMKG (conditional jika ada entry lama) lalu menyimpan hasil parse ke cache.
+    Dengan cache bersama, respons yang sudah diambil worker lain dipakai tanpa request ke BMKG
+    selama masih berlaku lebih dari `ahead` detik (lihat prefetch).
+    """
+    if shared_cache is None:
+        return await _fetch_upstream_and_store(url, parse, endpoint, entry)
+    value, entry, lease = await _read_shared(url, parse, endpoint, entry, ahead)
+    if value is not None:
+        return value
+    try:
+        return await _fetch_upstream_and_store(url, parse, endpoint, entry)
+    finally:
+        if lease:
+            await asyncio.to_thread(shared_cache.release, url)
+
+async def _fetch_upstream_and_store(url: str, parse, endpoint: str, entry: CacheEntry | None):
+    headers = {}
+    if entry is not None:
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+
+    response = await fetch_upstream(url, endpoint, headers)
+    ttl_func = CACHE_TTL_FUNCS.get(endpoint)
+
+    if response.status_code == 304 and entry is not None:
+        response_cache.count(endpoint, "not_modified")
+        ttl = ttl_func(entry.value) if ttl_func else CACHE_TTLS.get(endpoint, 60)
+        entry.fetched_at = time.monotonic()
+        entry.expires_at = entry.fetched_at + ttl
+        response_cache.put(url, entry)
+        if shared_cache is not None:
+            offset = monotonic_offset()
+            await asyncio.to_thread(shared_cache.touch, url, entry.fetched_at - offset, entry.expires_at - offset)
+        return entry.value
+
+    response.raise_for_status()
+    with span("parse"):
+        value = parse(response.content)
+    hook = RESPONSE_HOOKS.get(endpoint)
+    if hook is not None:
+        try:
+            await hook(value)
+        except Exception:
+            # Kegagalan hook (misalnya disk penuh) tidak boleh menggagalkan tool
+            response_cache.count(endpoint, "hook_error")
+    ttl = ttl_func(value) if ttl_func else CACHE_TTLS.get(endpoint, 60)
+    entry = CacheEntry(
+        value,
+        time.monotonic() + ttl,
+        response.headers.get("ETag"),
+        response.headers.get("Last-Modified")
+    )
+    response_cache.put(url, entry)
+    if shared_cache is not None:
+        offset = monotonic_offset()
+        await asyncio.to_thread(
+            shared_cache.put, url, response.content, entry.etag, entry.last_modified,
+            entry.fetched_at - offset, entry.expires_at - offset
+        )
+    return value
+
+def _start_flight(url: str, parse, endpoint: str, entry: CacheEntry | None, ahead: float = 0) -> asyncio.Task:
+    """
+    Single-flight: memulai request upstream untuk URL, atau mengembalikan request yang
+    sedang berjalan sehingga pemanggil bersamaan berbagi satu request dan hasil parse-nya.
+    """
+    task = response_cache.inflight.get(url)
+    if task is not None:
+        response_cache.count(endpoint, "coalesced")
+        return task
+
+    task = asyncio.create_task(_fetch_and_store(url, parse, endpoint, entry, ahead))
+    response_cache.inflight[url] = task
+
+    def done(finished: asyncio.Task):
+        if response_cache.inflight.get(url) is finished:
+            del response_cache.inflight[url]
+        # Tandai exception sudah diambil, untuk kasus semua penunggu dibatalkan
+        if not finished.cancelled():
+            finished.exception()
+
+    task.add_done_callback(done)
+    return task
+
+def _schedule_refresh(url: str, parse, endpoint: str, entry: CacheEntry):
+    """Memperbarui entry kedaluwarsa di background (sekali per URL)"""
+    if url in response_cache.inflight:
+        return
+
+    def done(finished: asyncio.Task):
+        if not finished.cancelled() and finished.exception() is not None:
+            response_cache.count(endpoint, "refresh_error")
+
+    _start_flight(url, parse, endpoint, entry).add_done_callback(done)
+
+async def fetch_cached(url: str, parse, endpoint: str):
+    """
+    Mengambil dan mem-parse respons BMKG melalui cache.
+
+    - Masih dalam TTL: langsung dari cache.
+    - Lewat TTL tapi masih dalam jendela stale: data lama dikembalikan, pembaruan di background.
+    - Selain itu: request ke BMKG (conditional bila ada ETag/Last-Modified). Pemanggil
+      bersamaan untuk URL yang sama menunggu satu request yang sama (single-flight).
+    - Bila BMKG gagal (koneksi, timeout, 5xx, circuit breaker terbuka) dan masih ada data
+      terakhir yang berusia di bawah LAST_GOOD_MAX_AGE: data itu dikembalikan dan dicatat di
+      upstream_fallbacks sehingga output tool ditandai "stale".
+
+    Raise httpx.HTTPStatusError untuk status selain 2xx/304.
+    """
+    entry = response_cache.get(url)
+    now = time.monotonic()
+
+    if entry is not None:
+        if now < entry.expires_at:
+            response_cache.count(endpoint, "hit")
+            return entry.value
+        if now < entry.expires_at + CACHE_STALE_WINDOW:
+            response_cache.count(endpoint, "stale")
+            _schedule_refresh(url, parse, endpoint, entry)
+            return entry.value
+
+    response_cache.count(endpoint, "miss")
+    try:
+        # shield: pembatalan satu pemanggil tidak membatalkan request yang ditunggu pemanggil lain
+        return await asyncio.shield(_start_flight(url, parse, endpoint, entry))
+    except httpx.HTTPError as e:
+        if entry is None or not is_upstream_failure(e) or now - entry.fetched_at > LAST_GOOD_MAX_AGE:
+            raise
+        response_cache.count(endpoint, "fallback")
+        fallbacks = upstream_fallbacks.get()
+        if fallbacks is not None:
+            fallbacks.append((endpoint, time.monotonic() - entry.fetched_at, str(e) or type(e).__name__))
+        return entry.value
+
+async def prefetch(url: str, parse, endpoint: str, ahead: float):
+    """
+    Memperbarui entry cache sebelum kedaluwarsa (job warming), sehingga pemanggil tidak pernah
+    menunggu BMKG. Entry dari worker lain dipakai bila masih berlaku lebih dari `ahead` detik.
+    """
+    response_cache.count(endpoint, "prefetch")
+    return await asyncio.shield(_start_flight(url, parse, endpoint, response_cache.get(url), ahead))
+
+@mcp.resource("bmkg://stats/cache", mime_type="application/json")
+def get_cache_stats() -> str:
+    """Statistik cache respons BMKG (hit, stale, miss, coalesced, not_modified, fallback per endpoint) dan circuit breaker"""
+    return dump_json({
+        **response_cache.snapshot_stats(),
+        "circuit_breakers": {host: breaker.snapshot() for host, breaker in sorted(circuit_breakers.items())}
+    }, indent=2)
+
+@mcp.resource("bmkg://metrics", mime_type="text/plain")
+def get_metrics() -> str:
+    """Metrics server dalam format teks Prometheus: durasi tahap per tool, request upstream, cache, byte output"""
+    return metrics.render(response_cache.stats)
+
+# Diisi serve_workers: pada mode multi-worker setiap worker mencatat metrics sendiri, sehingga /metrics
+# pada port utama (dilayani worker acak) ditolak dan metrics dibaca dari port per worker (--metrics-port)
+worker_metrics_ports: range | None = None
+
+async def worker_metrics_endpoint(request) -> PlainTextResponse:
+    """Endpoint scrape Prometheus untuk metrics proses ini"""
+    return PlainTextResponse(metrics.render(response_cache.stats), media_type="text/plain; version=0.0.4")
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request) -> PlainTextResponse:
+    """Endpoint scrape Prometheus saat server berjalan dengan transport SSE/streamable-HTTP"""
+    if worker_metrics_ports is None:
+        return await worker_metrics_endpoint(request)
+    if worker_metrics_ports:
+        hint = f"scrape port {worker_metrics_ports[0]}-{worker_metrics_ports[-1]} (satu port per worker)"
+    else:
+        hint = "jalankan dengan --metrics-port untuk endpoint metrics per worker"
+    return PlainTextResponse(
+        f"Error: /metrics tidak tersedia pada mode multi-worker karena setiap worker mencatat metrics sendiri; {hint}\n",
+        status_code=404
+    )
+
+# ---------------------------------------------------------------------------
+# Parser feed BMKG (TEWS Infogempa dan RSS nowcast)
+# ---------------------------------------------------------------------------
+
+@dataclass(slots=True)
+class GempaRecord:
+    """Satu elemen <gempa> dari feed TEWS (autogempa, gempaterkini, gempadirasakan)"""
+    tanggal: str = "-"
+    jam: str = "-"
+    datetime_utc: str = "-"
+    coordinates: str = "-"
+    lintang: str = "-"
+    bujur: str = "-"
+    magnitude: str = "-"
+    kedalaman: str = "-"
+    wilayah: str = "-"
+    potensi: str = "-"
+    dirasakan: str = "-"
+    shakemap: str = "-"
+
+    # Nilai numerik hasil parsing field teks di atas (None jika tidak bisa diparsing)
+    magnitude_value: float | None = field(default=None, init=False)
+    depth_km: float | None = field(default=None, init=False)
+    lat: float | None = field(default=None, init=False)
+    lon: float | None = field(default=None, init=False)
+    time: datetime | None = field(default=None, init=False)
+
+    def __post_init__(self):
+        self.magnitude_value = parse_number(self.magnitude)
+        self.depth_km = parse_number(self.kedalaman)
+        self.lat = parse_signed_coordinate(self.lintang, negative="LS")
+        self.lon = parse_signed_coordinate(self.bujur, negative="BB")
+        try:
+            self.time = datetime.fromisoformat(self.datetime_utc)
+        except ValueError:
+            self.time = None
+
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+
+def parse_number(text: str) -> float | None:
+    """Helper function untuk mengambil angka pertama dari teks BMKG (contoh: "10 km" -> 10.0)"""
+    match = NUMBER_PATTERN.search(text)
+    return float(match.group()) if match else None
+
+def parse_signed_coordinate(text: str, negative: str) -> float | None:
+    """Helper function konversi "5.12 LS" / "97.67 BT" menjadi derajat bertanda (LS dan BB negatif)"""
+    value = parse_number(text)
+    if value is None:
+        return None
+    return -abs(value) if text.rstrip().upper().endswith(negative) else value
+
+# Tag XML <gempa> -> field GempaRecord
+GEMPA_TAGS = {
+    "Tanggal": "tanggal",
+    "Jam": "jam",
+    "DateTime": "datetime_utc",
+    "Coordinates": "coordinates",
+    "Lintang": "lintang",
+    "Bujur": "bujur",
+    "Magnitude": "magnitude",
+    "Kedalaman": "kedalaman",
+    "Wilayah": "wilayah",
+    "Potensi": "potensi",
+    "Dirasakan": "dirasakan",
+    "Shakemap": "shakemap",
+}
+
+@dataclass(slots=True)
+class NowcastItem:
+    """Satu <item> RSS peringatan dini cuaca (nowcast)"""
+    title: str = "-"
+    link: str = "-"
+    description: str = "-"
+    author: str = "-"
+    pub_date: str = "-"
+
+@dataclass(slots=True)
+class NowcastFeed:
+    """RSS peringatan dini cuaca: metadata channel dan daftar item"""
+    title: str = "BMKG Weather Alerts"
+    last_build_date: str = "-"
+    items: list[NowcastItem] = field(default_factory=list)
+
+NOWCAST_ITEM_TAGS = {
+    "title": "title",
+    "link": "link",
+    "description": "description",
+    "author": "author",
+    "pubDate": "pub_date",
+}
+
+NOWCAST_CHANNEL_TAGS = {
+    "title": "title",
+    "lastBuildDate": "last_build_date",
+}
+
+def parse_gempa_xml(content: bytes) -> list[GempaRecord]:
+    """
+    Parser streaming untuk skema Infogempa/gempa. Membangun GempaRecord langsung dari
+    event iterparse tanpa membentuk dict bertingkat seperti xmltodict.
+    """
+    records = []
+    fields = {}
+    for _, element in ET.iterparse(io.BytesIO(content)):
+        tag = element.tag
+        if tag == "gempa":
+            records.append(GempaRecord(**fields))
+            fields = {}
+            element.clear()
+        else:
+            name = GEMPA_TAGS.get(tag)
+            if name is not None and element.text:
+                fields[name] = element.text.strip()
+    return records
+
+def parse_nowcast_xml(content: bytes) -> NowcastFeed:
+    """Parser streaming untuk RSS nowcast: hanya field channel dan item yang dipakai tools"""
+    feed = NowcastFeed()
+    path = []
+    fields = {}
+    for event, element in ET.iterparse(io.BytesIO(content), events=("start", "end")):
+        tag = element.tag
+        if event == "start":
+            path.append(tag)
+            continue
+
+        path.pop()
+        parent = path[-1] if path else None
+        if tag == "item":
+            feed.items.append(NowcastItem(**fields))
+            fields = {}
+            element.clear()
+        elif parent == "item":
+            name = NOWCAST_ITEM_TAGS.get(tag)
+            if name is not None and element.text:
+                fields[name] = element.text.strip()
+        elif parent == "channel":
+            name = NOWCAST_CHANNEL_TAGS.get(tag)
+            if name is not None and element.text:
+                setattr(feed, name, element.text.strip())
+    return feed
+
+def get_cap_code(link: str) -> str:
+    """Helper function untuk mengambil kode CAP dari link item RSS nowcast"""
+    return link.split('/')[-1].replace('_alert.xml', '')
+
+def get_cap_codes(feed: NowcastFeed) -> list[str]:
+    return [get_cap_code(item.link) for item in feed.items if '_alert.xml' in item.link]
+
+EARTH_RADIUS_KM = 6371.0
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Jarak great-circle (haversine) antara dua titik dalam kilometer"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+# Nilai parameter sort tools gempa -> (key, reverse)
+EARTHQUAKE_SORTS = {
+    "newest": (lambda item: item[0].time or datetime.min.replace(tzinfo=timezone.utc), True),
+    "oldest": (lambda item: item[0].time or datetime.max.replace(tzinfo=timezone.utc), False),
+    "magnitude": (lambda item: item[0].magnitude_value or 0.0, True),
+    "depth": (lambda item: item[0].depth_km if item[0].depth_km is not None else math.inf, False),
+    "distance": (lambda item: item[1] if item[1] is not None else math.inf, False),
+}
+
+def parse_since(since: str) -> datetime:
+    """Helper function parsing parameter since (ISO 8601; tanpa zona waktu dianggap UTC)"""
+    value = datetime.fromisoformat(since.strip())
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def filter_earthquakes(
+    records: list[GempaRecord],
+    min_magnitude: float | None = None,
+    max_depth: float | None = None,
+    bbox: tuple[float, float, float, float] | None = None,
+    center: tuple[float, float] | None = None,
+    radius_km: float | None = None,
+    since: datetime | None = None,
+    sort: str = "newest",
+) -> list[tuple[GempaRecord, float | None]]:
+    """
+    Menyaring dan mengurutkan record gempa. bbox berupa (min_lat, min_lon, max_lat, max_lon).
+    Mengembalikan pasangan (record, jarak_km ke center atau None). Record yang nilainya
+    tidak bisa diparsing tidak lolos filter yang memakai nilai tersebut.
+    """
+    matches = []
+    for record in records:
+        if min_magnitude is not None and (record.magnitude_value is None or record.magnitude_value < min_magnitude):
+            continue
+        if max_depth is not None and (record.depth_km is None or record.depth_km > max_depth):
+            continue
+        if since is not None and (record.time is None or record.time < since):
+            continue
+
+        has_position = record.lat is not None and record.lon is not None
+        if bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            if not has_position or not (min_lat <= record.lat <= max_lat and min_lon <= record.lon <= max_lon):
+                continue
+
+        distance = None
+        if center is not None and has_position:
+            distance = round(distance_km(center[0], center[1], record.lat, record.lon), 1)
+        if radius_km is not None and (distance is None or distance > radius_km):
+            continue
+
+        matches.append((record, distance))
+
+    key, reverse = EARTHQUAKE_SORTS[sort]
+    # sorted() stabil: urutan feed dipertahankan untuk nilai yang sama
+    return sorted(matches, key=key, reverse=reverse)
+
+def build_earthquake_filters(
+    min_magnitude: float | None,
+    max_depth: float | None,
+    min_lat: float | None,
+    min_lon: float | None,
+    max_lat: float | None,
+    max_lon: float | None,
+    lat: float | None,
+    lon: float | None,
+    radius_km: float | None,
+    since: str,
+    sort: str,
+) -> dict:
+    """
+    Validasi parameter filter tools gempa menjadi argumen filter_earthquakes.
+    Raise ValueError dengan pesan untuk pengguna jika kombinasi parameter tidak valid.
+    """
+    bbox_values = (min_lat, min_lon, max_lat, max_lon)
+    if any(value is not None for value in bbox_values) and any(value is None for value in bbox_values):
+        raise ValueError("Bounding box membutuhkan min_lat, min_lon, max_lat, dan max_lon")
+    if (lat is None) != (lon is None):
+        raise ValueError("Isi lat dan lon bersamaan")
+    if radius_km is not None and lat is None:
+        raise ValueError("radius_km membutuhkan lat dan lon")
+    if sort not in EARTHQUAKE_SORTS:
+        raise ValueError(f"sort tidak dikenal: '{sort}' (pilihan: {', '.join(EARTHQUAKE_SORTS)})")
+    if sort == "distance" and lat is None:
+        raise ValueError("sort 'distance' membutuhkan lat dan lon")
+    try:
+        since_time = parse_since(since) if since else None
+    except ValueError:
+        raise ValueError(f"Format since tidak valid: '{since}' (contoh: 2026-10-16T00:00:00+07:00)") from None
+
+    return {
+        "min_magnitude": min_magnitude,
+        "max_depth": max_depth,
+        "bbox": bbox_values if min_lat is not None else None,
+        "center": (lat, lon) if lat is not None else None,
+        "radius_km": radius_km,
+        "since": since_time,
+        "sort": sort,
+    }
+
+def describe_earthquake_filters(filters: dict) -> dict:
+    """Filter yang aktif dalam bentuk JSON untuk dicantumkan di output tools"""
+    described = {}
+    for name, value in filters.items():
+        if value is None or name == "sort":
+            continue
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, tuple):
+            value = list(value)
+        described[name] = value
+    return described
+
+def earthquake_to_dict(gempa: GempaRecord, text_fields: tuple[str, ...], distance: float | None = None) -> dict:
+    """Record gempa sebagai dict numerik untuk output tools"""
+    result = {
+        "waktu": f"{gempa.tanggal} - {gempa.jam}",
+        "datetime_utc": gempa.datetime_utc,
+        "magnitudo": gempa.magnitude_value,
+        "kedalaman_km": gempa.depth_km,
+        "lintang": gempa.lat,
+        "bujur": gempa.lon,
+        "lokasi": gempa.wilayah
+    }
+    for text_field in text_fields:
+        result[text_field] = getattr(gempa, text_field)
+    if distance is not None:
+        result["jarak_km"] = distance
+    return result
+
+async def query_earthquakes(url: str, endpoint: str, text_field: str, **params) -> str:
+    """Implementasi bersama get_significant_earthquakes dan get_felt_earthquakes"""
+    try:
+        filters = build_earthquake_filters(**params)
+    except ValueError as e:
+        return dump_json({"error": str(e)}, indent=2)
+
+    gempa_list = await fetch_cached(url, parse_gempa_xml, endpoint)
+    matches = filter_earthquakes(gempa_list, **filters)
+
+    return dump_json({
+        "total": len(matches),
+        "total_feed": len(gempa_list),
+        "filter": describe_earthquake_filters(filters),
+        "sort": filters["sort"],
+        "data": [earthquake_to_dict(gempa, (text_field,), distance) for gempa, distance in matches],
+        "sumber": BMKG_ATTRIBUTION
+    }, indent=2, ensure_ascii=False)
+
 @mcp.tool()
+@instrumented
 async def get_latest_earthquake() -> str:
     """
     Mengambil data gempa bumi terbaru yang dirasakan (M 5.0+ atau signifikan).
@@ -30,110 +1262,801 @@ async def get_latest_earthquake() -> str:
     Sumber Data: BMKG (Badan Meteorologi, Klimatologi, dan Geofisika)
     """
     url = "https://data.bmkg.go.id/DataMKG/TEWS/autogempa.xml"
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url)
-            data = xmltodict.parse(response.content)
-            gempa = data['Infogempa']['gempa']
-            
-            result = {
-                "waktu": f"{gempa['Tanggal']} - {gempa['Jam']}",
-                "magnitudo": gempa['Magnitude'],
-                "kedalaman": gempa['Kedalaman'],
-                "koordinat": f"{gempa['Lintang']}, {gempa['Bujur']}",
-                "lokasi": gempa['Wilayah'],
-                "potensi": gempa['Potensi'],
-                "dirasakan": gempa.get('Dirasakan', '-'),
-                "shakemap_url": f"https://static.bmkg.go.id/{gempa['Shakemap']}",
-                "sumber": BMKG_ATTRIBUTION
-            }
-            return json.dumps(result, indent=2, ensure_ascii=False)
-        except Exception as e:
-            return f"Gagal mengambil data gempa: {str(e)}"
+
+    try:
+        gempa = (await fetch_cached(url, parse_gempa_xml, "autogempa"))[0]
+
+        result = {
+            "waktu": f"{gempa.tanggal} - {gempa.jam}",
+            "magnitudo": gempa.magnitude,
+            "kedalaman": gempa.kedalaman,
+            "koordinat": f"{gempa.lintang}, {gempa.bujur}",
+            "lokasi": gempa.wilayah,
+            "potensi": gempa.potensi,
+            "dirasakan": gempa.dirasakan,
+            "shakemap_url": f"https://static.bmkg.go.id/{gempa.shakemap}",
+            "sumber": BMKG_ATTRIBUTION
+        }
+        return dump_json(result, indent=2, ensure_ascii=False)
+    except Exception as e:
+        return f"Gagal mengambil data gempa: {str(e)}"
 
 @mcp.tool()
-async def get_significant_earthquakes() -> str:
+@instrumented
+async def get_significant_earthquakes(
+    min_magnitude: float | None = None,
+    max_depth: float | None = None,
+    min_lat: float | None = None,
+    min_lon: float | None = None,
+    max_lat: float | None = None,
+    max_lon: float | None = None,
+    lat: float | None = None,
+    lon: float | None = None,
+    radius_km: float | None = None,
+    since: str = "",
+    sort: str = "newest"
+) -> str:
     """
     Mengambil daftar 15 gempabumi terkini dengan magnitudo 5.0 atau lebih.
     Mengembalikan detail waktu, lokasi, magnitudo, kedalaman, dan potensi tsunami.
+    Angka dikembalikan sebagai nilai numerik (magnitudo, kedalaman_km, lintang/bujur bertanda;
+    lintang selatan dan bujur barat negatif). Filter opsional diterapkan di server.
+
+    Args:
+        min_magnitude: Magnitudo minimum (contoh: 5.5)
+        max_depth: Kedalaman maksimum dalam km (contoh: 70)
+        min_lat, min_lon, max_lat, max_lon: Bounding box; keempatnya harus diisi bersamaan
+        lat, lon: Titik acuan untuk radius_km, jarak_km, dan sort "distance"
+        radius_km: Hanya gempa dalam radius ini (km) dari lat/lon
+        since: Hanya gempa sejak waktu ini (ISO 8601, contoh: "2026-10-16T00:00:00+07:00";
+               tanpa zona waktu dianggap UTC)
+        sort: "newest" (default), "oldest", "magnitude", "depth", atau "distance"
 
     Sumber Data: BMKG (Badan Meteorologi, Klimatologi, dan Geofisika)
     """
     url = "https://data.bmkg.go.id/DataMKG/TEWS/gempaterkini.xml"
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url)
-            data = xmltodict.parse(response.content)
-
-            gempa_list = data['Infogempa']['gempa']
-            if isinstance(gempa_list, dict):
-                gempa_list = [gempa_list]
-
-            results = []
-            for gempa in gempa_list:
-                result = {
-                    "waktu": f"{gempa['Tanggal']} - {gempa['Jam']}",
-                    "datetime_utc": gempa.get('DateTime', '-'),
-                    "magnitudo": gempa['Magnitude'],
-                    "kedalaman": gempa['Kedalaman'],
-                    "koordinat": f"{gempa['Lintang']}, {gempa['Bujur']}",
-                    "lokasi": gempa['Wilayah'],
-                    "potensi": gempa.get('Potensi', '-')
-                }
-                results.append(result)
-
-            return json.dumps({
-                "total": len(results),
-                "data": results,
-                "sumber": BMKG_ATTRIBUTION
-            }, indent=2, ensure_ascii=False)
-        except Exception as e:
-            return f"Gagal mengambil data gempa M 5.0+: {str(e)}"
+    try:
+        return await query_earthquakes(
+            url, "gempaterkini", "potensi",
+            min_magnitude=min_magnitude, max_depth=max_depth,
+            min_lat=min_lat, min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
+            lat=lat, lon=lon, radius_km=radius_km, since=since, sort=sort
+        )
+    except Exception as e:
+        return f"Gagal mengambil data gempa M 5.0+: {str(e)}"
 
 @mcp.tool()
-async def get_felt_earthquakes() -> str:
+@instrumented
+async def get_felt_earthquakes(
+    min_magnitude: float | None = None,
+    max_depth: float | None = None,
+    min_lat: float | None = None,
+    min_lon: float | None = None,
+    max_lat: float | None = None,
+    max_lon: float | None = None,
+    lat: float | None = None,
+    lon: float | None = None,
+    radius_km: float | None = None,
+    since: str = "",
+    sort: str = "newest"
+) -> str:
     """
     Mengambil daftar 15 gempabumi terkini yang dirasakan masyarakat.
     Mengembalikan detail waktu, lokasi, magnitudo, kedalaman, dan daerah yang merasakan.
+    Angka dikembalikan sebagai nilai numerik (magnitudo, kedalaman_km, lintang/bujur bertanda;
+    lintang selatan dan bujur barat negatif). Filter opsional diterapkan di server.
+
+    Args:
+        min_magnitude: Magnitudo minimum (contoh: 5.5)
+        max_depth: Kedalaman maksimum dalam km (contoh: 70)
+        min_lat, min_lon, max_lat, max_lon: Bounding box; keempatnya harus diisi bersamaan
+        lat, lon: Titik acuan untuk radius_km, jarak_km, dan sort "distance"
+        radius_km: Hanya gempa dalam radius ini (km) dari lat/lon
+        since: Hanya gempa sejak waktu ini (ISO 8601, contoh: "2026-10-16T00:00:00+07:00";
+               tanpa zona waktu dianggap UTC)
+        sort: "newest" (default), "oldest", "magnitude", "depth", atau "distance"
 
     Sumber Data: BMKG (Badan Meteorologi, Klimatologi, dan Geofisika)
     """
     url = "https://data.bmkg.go.id/DataMKG/TEWS/gempadirasakan.xml"
 
-    async with httpx.AsyncClient() as client:
+    try:
+        return await query_earthquakes(
+            url, "gempadirasakan", "dirasakan",
+            min_magnitude=min_magnitude, max_depth=max_depth,
+            min_lat=min_lat, min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
+            lat=lat, lon=lon, radius_km=radius_km, since=since, sort=sort
+        )
+    except Exception as e:
+        return f"Gagal mengambil data gempa dirasakan: {str(e)}"
+
+# ---------------------------------------------------------------------------
+# Riwayat gempa di disk (SQLite)
+# ---------------------------------------------------------------------------
+
+# Lokasi database riwayat gempa; string kosong untuk menonaktifkan
+HISTORY_PATH = os.environ.get("BMKG_HISTORY_PATH", os.path.join(os.path.dirname(__file__), "history.sqlite3"))
+HISTORY_MAX_RESULTS = 1000
+
+# Kolom teks GempaRecord disimpan apa adanya agar record bisa dibangun ulang persis seperti dari feed
+GEMPA_TEXT_COLUMNS = tuple(GEMPA_TAGS.values())
+
+HISTORY_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS earthquakes (
+    id INTEGER PRIMARY KEY,
+    {", ".join(f"{column} TEXT NOT NULL" for column in GEMPA_TEXT_COLUMNS)},
+    time_unix REAL NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    magnitude_value REAL,
+    depth_km REAL,
+    first_seen TEXT NOT NULL,
+    UNIQUE (datetime_utc, lat, lon)
+);
+CREATE INDEX IF NOT EXISTS earthquakes_time ON earthquakes (time_unix);
+CREATE INDEX IF NOT EXISTS earthquakes_magnitude ON earthquakes (magnitude_value);
+CREATE INDEX IF NOT EXISTS earthquakes_position ON earthquakes (lat, lon);
+"""
+
+# Gempa yang sama muncul di beberapa feed; field "-" dilengkapi dari feed lain (misalnya Dirasakan)
+HISTORY_INSERT = f"""
+INSERT INTO earthquakes ({", ".join(GEMPA_TEXT_COLUMNS)}, time_unix, lat, lon, magnitude_value, depth_km, first_seen)
+VALUES ({", ".join("?" * (len(GEMPA_TEXT_COLUMNS) + 6))})
+ON CONFLICT (datetime_utc, lat, lon) DO UPDATE SET
+    {", ".join(f"{column} = CASE WHEN {column} = '-' THEN excluded.{column} ELSE {column} END" for column in GEMPA_TEXT_COLUMNS)}
+"""
+
+# Urutan SQL untuk tiap nilai sort (sort "distance" dihitung setelah query)
+HISTORY_ORDER = {
+    "newest": "time_unix DESC",
+    "oldest": "time_unix ASC",
+    "magnitude": "magnitude_value DESC, time_unix DESC",
+    "depth": "depth_km IS NULL, depth_km ASC, time_unix DESC",
+    "distance": "time_unix DESC",
+}
+
+class HistoryStore:
+    """
+    Penyimpanan riwayat gempa append-only di SQLite, diisi dari setiap respons feed TEWS
+    yang baru di-parse dan dideduplikasi berdasarkan DateTime dan koordinat.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection: sqlite3.Connection | None = None
+        # Koneksi dipakai dari thread pool asyncio.to_thread, akses diserialkan
+        self.lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(HISTORY_SCHEMA)
+            self.connection = connection
+        return self.connection
+
+    def record(self, records: list[GempaRecord]):
+        """Menyimpan record gempa yang waktu dan koordinatnya valid"""
+        first_seen = datetime.now(timezone.utc).isoformat()
+        rows = [
+            (
+                *(getattr(gempa, column) for column in GEMPA_TEXT_COLUMNS),
+                gempa.time.timestamp(), gempa.lat, gempa.lon, gempa.magnitude_value, gempa.depth_km, first_seen
+            )
+            for gempa in records
+            if gempa.time is not None and gempa.lat is not None and gempa.lon is not None
+        ]
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.executemany(HISTORY_INSERT, rows)
+
+    def query(
+        self,
+        min_magnitude: float | None = None,
+        max_depth: float | None = None,
+        bbox: tuple[float, float, float, float] | None = None,
+        center: tuple[float, float] | None = None,
+        radius_km: float | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        sort: str = "newest",
+        limit: int = 100,
+    ) -> tuple[list[tuple[GempaRecord, float | None]], int]:
+        """
+        Query riwayat dengan filter yang sama seperti filter_earthquakes, plus batas waktu `until`.
+        Filter waktu, magnitudo, kedalaman, dan bounding box dijalankan di SQLite memakai indeks;
+        radius disaring kasar dengan bounding box lalu dihitung tepat dengan haversine.
+        Mengembalikan (hasil, jumlah gempa di database).
+        """
+        conditions, values = [], []
+        if min_magnitude is not None:
+            conditions.append("magnitude_value >= ?")
+            values.append(min_magnitude)
+        if max_depth is not None:
+            conditions.append("depth_km <= ?")
+            values.append(max_depth)
+        if since is not None:
+            conditions.append("time_unix >= ?")
+            values.append(since.timestamp())
+        if until is not None:
+            conditions.append("time_unix <= ?")
+            values.append(until.timestamp())
+        if bbox is not None:
+            conditions.append("lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?")
+            values.extend((bbox[0], bbox[2], bbox[1], bbox[3]))
+        if radius_km is not None:
+            lat_delta = radius_km / 111.0
+            lon_delta = radius_km / (111.0 * max(math.cos(math.radians(center[0])), 0.01))
+            conditions.append("lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?")
+            values.extend((center[0] - lat_delta, center[0] + lat_delta, center[1] - lon_delta, center[1] + lon_delta))
+
+        sql = f"SELECT {', '.join(GEMPA_TEXT_COLUMNS)} FROM earthquakes"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {HISTORY_ORDER[sort]}"
+        # Radius dan sort jarak disaring di Python, jadi LIMIT baru diterapkan setelahnya
+        if radius_km is None and sort != "distance":
+            sql += " LIMIT ?"
+            values.append(limit)
+
+        with self.lock:
+            connection = self.connect()
+            rows = connection.execute(sql, values).fetchall()
+            total = connection.execute("SELECT COUNT(*) FROM earthquakes").fetchone()[0]
+
+        records = [GempaRecord(**dict(zip(GEMPA_TEXT_COLUMNS, row))) for row in rows]
+        matches = filter_earthquakes(records, center=center, radius_km=radius_km, sort=sort)
+        return matches[:limit], total
+
+history_store = HistoryStore(HISTORY_PATH) if HISTORY_PATH else None
+
+async def record_earthquake_history(records: list[GempaRecord]):
+    """Hook respons feed TEWS: menyimpan record ke riwayat tanpa memblokir event loop"""
+    if history_store is not None:
+        await asyncio.to_thread(history_store.record, records)
+
+for endpoint in ("autogempa", "gempaterkini", "gempadirasakan"):
+    RESPONSE_HOOKS[endpoint] = record_earthquake_history
+
+@mcp.tool()
+@instrumented
+async def query_earthquake_history(
+    since: str = "",
+    until: str = "",
+    min_magnitude: float | None = None,
+    max_depth: float | None = None,
+    min_lat: float | None = None,
+    min_lon: float | None = None,
+    max_lat: float | None = None,
+    max_lon: float | None = None,
+    lat: float | None = None,
+    lon: float | None = None,
+    radius_km: float | None = None,
+    sort: str = "newest",
+    limit: int = 100
+) -> str:
+    """
+    Mencari gempa di riwayat lokal yang dikumpulkan server dari feed BMKG (gempa terbaru,
+    M 5.0+, dan dirasakan), tanpa akses jaringan. Feed BMKG hanya memuat 15 gempa terakhir,
+    sehingga tool ini dipakai untuk pertanyaan seperti "gempa bulan ini".
+
+    Args:
+        since: Awal rentang waktu (ISO 8601, contoh: "2026-10-01T00:00:00+07:00";
+               tanpa zona waktu dianggap UTC)
+        until: Akhir rentang waktu (format sama dengan since)
+        min_magnitude: Magnitudo minimum (contoh: 5.0)
+        max_depth: Kedalaman maksimum dalam km (contoh: 70)
+        min_lat, min_lon, max_lat, max_lon: Bounding box; keempatnya harus diisi bersamaan
+        lat, lon: Titik acuan untuk radius_km, jarak_km, dan sort "distance"
+        radius_km: Hanya gempa dalam radius ini (km) dari lat/lon
+        sort: "newest" (default), "oldest", "magnitude", "depth", atau "distance"
+        limit: Jumlah maksimal hasil (default: 100, maks. 1000)
+
+    Returns:
+        Daftar gempa numerik (sama seperti get_significant_earthquakes) beserta potensi
+        dan daerah yang merasakan bila tercatat.
+
+    Sumber Data: BMKG (Badan Meteorologi, Klimatologi, dan Geofisika)
+    """
+    try:
+        if history_store is None:
+            return dump_json({"error": "Riwayat gempa dinonaktifkan (BMKG_HISTORY_PATH kosong)"}, indent=2)
+
+        try:
+            filters = build_earthquake_filters(
+                min_magnitude=min_magnitude, max_depth=max_depth,
+                min_lat=min_lat, min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
+                lat=lat, lon=lon, radius_km=radius_km, since=since, sort=sort
+            )
+        except ValueError as e:
+            return dump_json({"error": str(e)}, indent=2)
         try:
-            response = await client.get(url)
-            data = xmltodict.parse(response.content)
-
-            gempa_list = data['Infogempa']['gempa']
-            if isinstance(gempa_list, dict):
-                gempa_list = [gempa_list]
-
-            results = []
-            for gempa in gempa_list:
-                result = {
-                    "waktu": f"{gempa['Tanggal']} - {gempa['Jam']}",
-                    "datetime_utc": gempa.get('DateTime', '-'),
-                    "magnitudo": gempa['Magnitude'],
-                    "kedalaman": gempa['Kedalaman'],
-                    "koordinat": f"{gempa['Lintang']}, {gempa['Bujur']}",
-                    "lokasi": gempa['Wilayah'],
-                    "dirasakan": gempa.get('Dirasakan', '-')
+            until_time = parse_since(until) if until else None
+        except ValueError:
+            return dump_json({"error": f"Format until tidak valid: '{until}' (contoh: 2026-10-31T23:59:59+07:00)"}, indent=2)
+        limit = min(max(1, limit), HISTORY_MAX_RESULTS)
+
+        matches, total = await asyncio.to_thread(history_store.query, **filters, until=until_time, limit=limit)
+
+        described = describe_earthquake_filters(filters)
+        if until_time is not None:
+            described["until"] = until_time.isoformat()
+        return dump_json({
+            "total": len(matches),
+            "total_history": total,
+            "filter": described,
+            "sort": sort,
+            "data": [earthquake_to_dict(gempa, ("potensi", "dirasakan"), distance) for gempa, distance in matches],
+            "sumber": BMKG_ATTRIBUTION
+        }, indent=2, ensure_ascii=False)
+
+    except Exception as e:
+        return f"Gagal mengambil riwayat gempa: {str(e)}"
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), "base.csv")
+
+# Snapshot biner indeks wilayah, dibangun otomatis dari base.csv bila belum ada atau usang
+SNAPSHOT_PATH = os.environ.get("BMKG_INDEX_PATH", os.path.join(os.path.dirname(__file__), "base.idx"))
+SNAPSHOT_VERSION = 2
+
+# Level administratif berdasarkan jumlah segmen kode wilayah
+ADMIN_LEVELS = {
+    1: ("province", "Provinsi"),
+    2: ("regency", "Kabupaten/Kota"),
+    3: ("district", "Kecamatan"),
+    4: ("village", "Kelurahan/Desa"),
+}
+
+# Nilai parameter admin_level yang diterima tools -> jumlah segmen kode
+ADMIN_LEVEL_FILTERS = {
+    "province": 1, "provinsi": 1,
+    "regency": 2, "kabkota": 2,
+    "district": 3, "kecamatan": 3,
+    "village": 4, "desa": 4,
+}
+
+def get_code_level(code: str) -> int:
+    """Helper function untuk menentukan level kode wilayah (1-4, 0 jika tidak dikenal)"""
+    parts = code.split('.')
+    if len(parts) == 1 and len(code) != 2:
+        return 0
+    return len(parts) if len(parts) in ADMIN_LEVELS else 0
+
+# Batas jumlah hasil search_location_code per halaman
+MAX_SEARCH_RESULTS = 200
+
+# Ukuran halaman default dan maksimal untuk tools yang mendukung pagination
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+def parse_offset_cursor(cursor: str) -> int:
+    """Helper function cursor pagination berbasis posisi ("" untuk halaman pertama); raise ValueError jika tidak valid"""
+    if not cursor.strip():
+        return 0
+    offset = int(cursor)
+    if offset < 0:
+        raise ValueError(cursor)
+    return offset
+
+def is_descendant_cursor(code: str, level: int, cursor: str) -> bool:
+    """Cursor berbasis kode (hasil terakhir halaman sebelumnya) harus turunan `code` pada `level`"""
+    return (
+        cursor in get_region_index().names
+        and get_code_level(cursor) == level
+        and (not code or cursor.startswith(f"{code}."))
+    )
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Helper function jarak Damerau-Levenshtein (optimal string alignment).
+    Berhenti lebih awal dan mengembalikan max_distance + 1 jika jarak melebihi batas.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+
+    return previous[-1]
+
+def get_admin_level(code: str) -> tuple:
+    """Helper function untuk mendapatkan (level_code, level_name) dari kode wilayah"""
+    return ADMIN_LEVELS.get(get_code_level(code), ("unknown", "Unknown"))
+
+class RegionIndex:
+    """
+    Indeks kode wilayah dari base.csv yang disimpan di memori.
+
+    Memetakan kode -> nama beserta daftar anak tiap kode, sehingga pencarian nama,
+    hierarki, dan daftar desa cukup berupa lookup dictionary tanpa membaca ulang CSV.
+    """
+
+    def __init__(self, rows):
+        self.names: dict[str, str] = {}
+        self.children: dict[str, list[str]] = {}
+
+        for code, name in rows:
+            self.names[code] = name
+            self.children.setdefault(self.parent(code), []).append(code)
+
+        # Indeks terbalik n-gram (1-3 karakter) atas nama huruf kecil, dipisah per level
+        # administratif. Posting list berisi nomor baris base.csv yang terurut naik.
+        self.codes: list[str] = list(self.names)
+        self.names_lower: list[str] = [name.lower() for name in self.names.values()]
+        self.levels = bytearray()
+        self.level_ids: dict[int, array | bytes] = {}
+        self.grams: dict[int, dict[str, array | bytes]] = {}
+
+        for row_id, (code, name_lower) in enumerate(zip(self.codes, self.names_lower)):
+            level = get_code_level(code)
+            self.levels.append(level)
+            self.level_ids.setdefault(level, array('i')).append(row_id)
+            level_grams = self.grams.setdefault(level, {})
+            for gram in self._ngrams(name_lower):
+                posting = level_grams.get(gram)
+                if posting is None:
+                    level_grams[gram] = array('i', (row_id,))
+                else:
+                    posting.append(row_id)
+
+        # Posting list disimpan sebagai bytes (int32) agar bisa ditulis ke snapshot apa adanya
+        self.level_ids = {level: ids.tobytes() for level, ids in self.level_ids.items()}
+        self.grams = {
+            level: {gram: posting.tobytes() for gram, posting in level_grams.items()}
+            for level, level_grams in self.grams.items()
+        }
+
+        # Indeks token dan deletion untuk pencarian fuzzy, ikut disimpan di snapshot
+        self.tokens: dict[str, bytes] = {}
+        self.deletes: dict[str, str] = {}
+        self._build_fuzzy_index()
+
+    @staticmethod
+    def _ngrams(text: str) -> set[str]:
+        """Semua n-gram unik (n = 1..3) dari sebuah teks"""
+        return {text[i:i + n] for n in (1, 2, 3) for i in range(len(text) - n + 1)}
+
+    @classmethod
+    def from_csv(cls, csv_path: str) -> "RegionIndex":
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            return cls((row[0].strip(), row[1].strip()) for row in reader if len(row) >= 2)
+
+    def to_snapshot(self) -> dict:
+        """Struktur data indeks dalam bentuk yang bisa diserialisasi dengan marshal"""
+        return {
+            "codes": self.codes,
+            "names": list(self.names.values()),
+            "names_lower": self.names_lower,
+            "children": self.children,
+            "levels": bytes(self.levels),
+            "level_ids": self.level_ids,
+            "grams": self.grams,
+            "tokens": self.tokens,
+            "deletes": self.deletes,
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: dict) -> "RegionIndex":
+        """Membuat indeks langsung dari hasil to_snapshot() tanpa membangun ulang"""
+        index = cls.__new__(cls)
+        index.codes = data["codes"]
+        index.names = dict(zip(data["codes"], data["names"]))
+        index.names_lower = data["names_lower"]
+        index.children = data["children"]
+        index.levels = data["levels"]
+        index.level_ids = data["level_ids"]
+        index.grams = data["grams"]
+        index.tokens = data["tokens"]
+        index.deletes = data["deletes"]
+        return index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def parent(code: str) -> str:
+        """Kode induk dari sebuah kode wilayah ("" untuk provinsi)"""
+        return code.rpartition('.')[0]
+
+    def get_children(self, code: str) -> list[str]:
+        return self.children.get(code, [])
+
+    def iter_descendants(self, code: str, level: int, after: str = ""):
+        """
+        Iterasi semua turunan `code` pada level tertentu, urut sesuai base.csv.
+        Dengan `after` (turunan `code` pada level tersebut), iterasi dilanjutkan setelah kode itu
+        dengan melompat langsung ke cabangnya, tanpa mengulang turunan sebelumnya (cursor pagination).
+        """
+        children = self.get_children(code)
+        start = 0
+        if after:
+            # Leluhur `after` yang merupakan anak langsung `code`
+            branch = '.'.join(after.split('.')[:len(code.split('.')) + 1 if code else 1])
+            start = children.index(branch) + 1
+            if branch != after:
+                yield from self.iter_descendants(branch, level, after)
+
+        for child in islice(children, start, None):
+            child_level = get_code_level(child)
+            if child_level == level:
+                yield child
+            elif child_level and child_level < level:
+                yield from self.iter_descendants(child, level)
+
+    def search(self, query: str, level: int | None = None, limit: int | None = None) -> list[str]:
+        """
+        Mencari kode wilayah yang namanya mengandung `query` (case-insensitive).
+
+        Kandidat diambil dari posting list n-gram query lalu diverifikasi dengan
+        pencocokan substring, sehingga pencarian berhenti begitu `limit` hasil terkumpul.
+        Hasil terurut sesuai base.csv.
+        """
+        return [self.codes[row_id] for row_id in islice(self.search_rows(query, level), limit)]
+
+    def search_rows(self, query: str, level: int | None = None, after: int = -1):
+        """
+        Iterator nomor baris hasil search() yang dimulai setelah baris `after`. Posisi awal
+        dicari dengan bisect pada posting list, sehingga halaman berikutnya tidak memindai ulang
+        hasil halaman sebelumnya.
+        """
+        query = query.lower()
+        levels = [level] if level else sorted(self.level_ids)
+        streams = [self._search_level(query, lvl, after) for lvl in levels]
+        return streams[0] if len(streams) == 1 else heapq.merge(*streams)
+
+    def _search_level(self, query: str, level: int, after: int = -1):
+        if not query:
+            row_ids = memoryview(self.level_ids.get(level, b"")).cast('i')
+            yield from row_ids[bisect.bisect_right(row_ids, after):]
+            return
+
+        level_grams = self.grams.get(level, {})
+        n = min(3, len(query))
+        postings = []
+        for i in range(len(query) - n + 1):
+            posting = level_grams.get(query[i:i + n])
+            if posting is None:
+                return
+            postings.append(posting)
+
+        # Posting list terpendek menjadi kandidat; verifikasi substring sekaligus
+        # menggantikan irisan dengan posting list lainnya (lebih murah di Python).
+        names_lower = self.names_lower
+        candidates = memoryview(min(postings, key=len)).cast('i')
+        for row_id in candidates[bisect.bisect_right(candidates, after):]:
+            if query in names_lower[row_id]:
+                yield row_id
+
+    @staticmethod
+    def _deletes(token: str, depth: int = 1) -> set[str]:
+        """Token beserta semua variannya dengan hingga `depth` karakter dihapus"""
+        variants = {token}
+        frontier = {token}
+        for _ in range(depth):
+            frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+            variants |= frontier
+        return variants
+
+    def _build_fuzzy_index(self):
+        """
+        Membangun indeks token (token -> nomor baris) dan indeks deletion ala SymSpell
+        (varian hapus-1 karakter -> token), sehingga kandidat typo didapat lewat lookup.
+        """
+        tokens: dict[str, array] = {}
+        for row_id, name_lower in enumerate(self.names_lower):
+            for token in set(TOKEN_PATTERN.findall(name_lower)):
+                tokens.setdefault(token, array('i')).append(row_id)
+
+        deletes: dict[str, list[str]] = {}
+        for token in tokens:
+            for variant in self._deletes(token):
+                deletes.setdefault(variant, []).append(token)
+
+        # Posting list token disimpan sebagai bytes (int32) seperti posting list n-gram dan daftar
+        # token per varian digabung dengan spasi (token tidak mengandung spasi), agar snapshot
+        # tidak berisi ratusan ribu list kecil yang lambat dimuat
+        self.tokens = {token: posting.tobytes() for token, posting in tokens.items()}
+        self.deletes = {variant: " ".join(words) for variant, words in deletes.items()}
+
+    def fuzzy_rows(self, query: str, level: int | None = None, limit: int = 50, after: tuple = ()) -> list[tuple]:
+        """
+        Pencarian toleran typo. Mengembalikan kunci peringkat (jarak edit, level, selisih panjang
+        nama, nomor baris) yang diurutkan: jarak, level administratif (provinsi lebih dulu), lalu
+        kemiripan panjang nama. Kunci selalu unik, sehingga `after` (kunci terakhir halaman
+        sebelumnya) melanjutkan peringkat yang sama tanpa hasil ganda atau terlewat.
+
+        Nama yang mengandung query persis (substring) mendapat jarak 0. Selain itu setiap token
+        query dicocokkan ke token nama dengan jarak maksimal 1 (token <= 4 huruf) atau 2.
+
+        Indeks deletion hanya menyimpan varian hapus-1 dari token nama, jadi token nama yang
+        lebih panjang 2 huruf dari token query (dua huruf terlewat; mis. "semrang" -> "semarang"
+        masih terjangkau, "smrng" tidak) tidak akan ditemukan lewat pencarian token.
+        """
+        query = query.lower().strip()
+        scores: dict[int, int] = {}
+
+        # Kecocokan substring persis (jarak 0). Level diurutkan sesuai peringkat, jadi pemindaian
+        # berhenti setelah level yang sudah mengisi `limit`; di dalam level itu semua kecocokan
+        # ikut diperingkat berdasarkan kemiripan panjang, bukan urutan baris di CSV.
+        query_length = len(query)
+        names_lower = self.names_lower
+        for lvl in ([level] if level else sorted(self.level_ids)):
+            needed = limit - len(scores)
+            if needed <= 0:
+                break
+            keys = ((0, lvl, abs(len(names_lower[row_id]) - query_length), row_id) for row_id in self._search_level(query, lvl))
+            for key in heapq.nsmallest(needed, (key for key in keys if key > after)):
+                scores[key[3]] = 0
+
+        token_scores: dict[int, int] | None = None
+        for query_token in TOKEN_PATTERN.findall(query):
+            max_distance = 1 if len(query_token) <= 4 else 2
+            candidates = set()
+            # Deletion indeks menyimpan varian hapus-1; sisi query boleh hapus hingga
+            # max_distance karakter agar typo ganda (mis. "baroe" -> "baru") tetap terjangkau.
+            for variant in self._deletes(query_token, max_distance):
+                candidates.update(self.deletes.get(variant, "").split())
+
+            current: dict[int, int] = {}
+            for token in candidates:
+                distance = edit_distance(query_token, token, max_distance)
+                if distance > max_distance:
+                    continue
+                for row_id in memoryview(self.tokens[token]).cast('i'):
+                    if level and self.levels[row_id] != level:
+                        continue
+                    if distance < current.get(row_id, max_distance + 1):
+                        current[row_id] = distance
+
+            if token_scores is None:
+                token_scores = current
+            else:
+                token_scores = {
+                    row_id: score + current[row_id]
+                    for row_id, score in token_scores.items() if row_id in current
                 }
-                results.append(result)
 
-            return json.dumps({
-                "total": len(results),
-                "data": results,
-                "sumber": BMKG_ATTRIBUTION
-            }, indent=2, ensure_ascii=False)
-        except Exception as e:
-            return f"Gagal mengambil data gempa dirasakan: {str(e)}"
+        for row_id, score in (token_scores or {}).items():
+            # Nama yang mengandung query tetap berjarak 0 walau tidak ikut diambil di atas
+            if score and query in names_lower[row_id]:
+                score = 0
+            scores.setdefault(row_id, score)
+
+        keys = (
+            (score, self.levels[row_id] or 5, abs(len(names_lower[row_id]) - query_length), row_id)
+            for row_id, score in scores.items()
+        )
+        return heapq.nsmallest(limit, (key for key in keys if key > after))
+
+    def hierarchy(self, code: str) -> str:
+        parts = code.split('.')
+        hierarchy_parts = []
+        for i in range(1, min(len(parts), 4) + 1):
+            ancestor = '.'.join(parts[:i]) if i < 4 else code
+            hierarchy_parts.append(self.names.get(ancestor, ancestor))
+        return " > ".join(hierarchy_parts)
+
+def file_sha256(path: str) -> str:
+    """Helper function untuk menghitung hash SHA-256 sebuah file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_region_snapshot(snapshot_path: str, csv_hash: str) -> RegionIndex | None:
+    """Memuat snapshot indeks wilayah, None jika tidak ada, rusak, atau tidak cocok dengan base.csv"""
+    try:
+        # marshal.loads atas seluruh isi file jauh lebih cepat daripada marshal.load(f)
+        with open(snapshot_path, 'rb') as f:
+            data = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+    if not isinstance(data, dict):
+        return None
+    # Format marshal bergantung pada versi Python, jadi snapshot dari versi lain dianggap usang
+    if (data.get("version") != SNAPSHOT_VERSION or data.get("csv_sha256") != csv_hash
+            or data.get("python") != tuple(sys.version_info[:2])):
+        return None
+    try:
+        return RegionIndex.from_snapshot(data["index"])
+    except (KeyError, ValueError, EOFError, TypeError):
+        return None
+
+def build_region_snapshot(csv_path: str, snapshot_path: str, csv_hash: str | None = None) -> RegionIndex:
+    """Membangun indeks wilayah dari base.csv lalu menyimpannya sebagai snapshot biner"""
+    csv_hash = csv_hash or file_sha256(csv_path)
+    index = RegionIndex.from_csv(csv_path)
+    data = {
+        "version": SNAPSHOT_VERSION,
+        "csv_sha256": csv_hash,
+        "python": tuple(sys.version_info[:2]),
+        "index": index.to_snapshot()
+    }
+
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(marshal.dumps(data))
+        os.replace(tmp_path, snapshot_path)
+    except OSError:
+        # Direktori read-only: indeks tetap dipakai dari memori tanpa snapshot
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return index
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Lock eksklusif antar proses (fcntl.flock) atas `path`, sehingga pekerjaan berat seperti
+    membangun snapshot hanya dilakukan satu worker. Tanpa fcntl atau bila file tidak dapat
+    dibuat, berjalan tanpa lock (penulisan snapshot tetap atomik lewat os.replace).
+    """
+    try:
+        lock_file = open(path, 'a') if fcntl is not None else None
+    except OSError:
+        lock_file = None
+    if lock_file is None:
+        yield
+        return
+    with lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+_region_index: RegionIndex | None = None
+
+def get_region_index() -> RegionIndex:
+    """
+    Memuat indeks wilayah sekali per proses (lazy, saat pertama kali dipakai).
+    Snapshot biner dipakai bila hash base.csv cocok; jika tidak, dibangun ulang otomatis.
+    """
+    global _region_index
+    if _region_index is None:
+        with span("index_load"):
+            csv_hash = file_sha256(CSV_PATH)
+            index = load_region_snapshot(SNAPSHOT_PATH, csv_hash)
+            if index is None:
+                # Worker lain mungkin sedang membangun snapshot yang sama: tunggu lalu muat hasilnya
+                with file_lock(f"{SNAPSHOT_PATH}.lock"):
+                    index = (
+                        load_region_snapshot(SNAPSHOT_PATH, csv_hash)
+                        or build_region_snapshot(CSV_PATH, SNAPSHOT_PATH, csv_hash)
+                    )
+            _region_index = index
+    return _region_index
 
 @mcp.tool()
-async def search_location_code(location_name: str, admin_level: str = "all") -> str:
+@instrumented
+async def search_location_code(
+    location_name: str,
+    admin_level: str = "all",
+    fuzzy: bool = False,
+    max_results: int = 50,
+    cursor: str = ""
+) -> str:
     """
     Mencari kode wilayah Indonesia berdasarkan nama lokasi menggunakan database lokal.
     Mendukung pencarian di semua level: provinsi, kabupaten/kota, kecamatan, kelurahan/desa.
@@ -146,180 +2069,699 @@ async def search_location_code(location_name: str, admin_level: str = "all") ->
                     - "district" atau "kecamatan" untuk kecamatan
                     - "village" atau "desa" untuk kelurahan/desa
                     - "all" untuk mencari di semua level (default)
+        fuzzy: True untuk pencarian toleran salah ketik (contoh: "Sumpyuh" -> "Sumpiuh").
+               Hasil diurutkan berdasarkan kemiripan dan level administratif (default: False)
+        max_results: Jumlah hasil maksimal per halaman, 1-200 (default: 50)
+        cursor: Nilai "next_cursor" dari halaman sebelumnya dengan parameter pencarian yang sama;
+                kosongkan untuk halaman pertama
 
     Returns:
-        Daftar kode wilayah yang cocok dengan pencarian, dengan hierarki lengkap.
+        Daftar kode wilayah yang cocok dengan pencarian, dengan hierarki lengkap, beserta
+        next_cursor bila masih ada hasil berikutnya.
 
     Note:
         Kode level desa (4 segmen) dapat langsung digunakan untuk get_weather_forecast()
     """
     try:
-        csv_path = os.path.join(os.path.dirname(__file__), "base.csv")
-
-        if not os.path.exists(csv_path):
-            return json.dumps({
+        if not os.path.exists(CSV_PATH):
+            return dump_json({
                 "error": "File base.csv tidak ditemukan",
-                "path": csv_path
+                "path": CSV_PATH
             }, indent=2)
 
+        index = get_region_index()
         results = []
         location_lower = location_name.lower().strip()
+        level_filter = ADMIN_LEVEL_FILTERS.get(admin_level)
 
-        def get_admin_level(code: str) -> tuple:
-            parts = code.split('.')
-            if len(parts) == 1 and len(code) == 2:
-                return ("province", "Provinsi")
-            elif len(parts) == 2:
-                return ("regency", "Kabupaten/Kota")
-            elif len(parts) == 3:
-                return ("district", "Kecamatan")
-            elif len(parts) == 4:
-                return ("village", "Kelurahan/Desa")
-            return ("unknown", "Unknown")
-
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if len(row) < 2:
-                    continue
-
-                code = row[0].strip()
-                name = row[1].strip()
-                level_code, level_name = get_admin_level(code)
-
-                if admin_level != "all":
-                    if admin_level in ["province", "provinsi"] and level_code != "province":
-                        continue
-                    elif admin_level in ["regency", "kabkota"] and level_code != "regency":
-                        continue
-                    elif admin_level in ["district", "kecamatan"] and level_code != "district":
-                        continue
-                    elif admin_level in ["village", "desa"] and level_code != "village":
-                        continue
-
-                if location_lower in name.lower():
-                    hierarchy = get_hierarchy(code, csv_path)
-
-                    results.append({
-                        "code": code,
-                        "name": name,
-                        "level": level_name,
-                        "hierarchy": hierarchy,
-                        "ready_for_weather_api": level_code == "village"
-                    })
-
-        results = results[:50]
+        max_results = max(1, min(max_results, MAX_SEARCH_RESULTS))
+        try:
+            # Fuzzy: kunci peringkat hasil terakhir; substring: nomor baris base.csv hasil terakhir
+            if fuzzy:
+                after = tuple(int(part) for part in cursor.split("-")) if cursor.strip() else ()
+                if after and len(after) != 4:
+                    raise ValueError(cursor)
+            else:
+                position = int(cursor) if cursor.strip() else -1
+        except ValueError:
+            return dump_json({"error": f"Cursor tidak valid: '{cursor}'"}, indent=2)
+
+        if fuzzy:
+            with span("search"):
+                keys = index.fuzzy_rows(location_lower, level_filter, limit=max_results + 1, after=after)
+            has_more = len(keys) > max_results
+            keys = keys[:max_results]
+            matches = [(index.codes[key[3]], key[0]) for key in keys]
+            next_cursor = "-".join(map(str, keys[-1])) if has_more else None
+        else:
+            # Hanya hasil halaman ini (+1 untuk mengetahui ada halaman berikutnya) yang diambil
+            with span("search"):
+                rows = list(islice(index.search_rows(location_lower, level_filter, after=position), max_results + 1))
+            has_more = len(rows) > max_results
+            rows = rows[:max_results]
+            matches = [(index.codes[row_id], None) for row_id in rows]
+            next_cursor = str(rows[-1]) if has_more else None
+
+        for code, distance in matches:
+            level_code, level_name = get_admin_level(code)
+            result = {
+                "code": code,
+                "name": index.names[code],
+                "level": level_name,
+                "hierarchy": get_hierarchy(code),
+                "ready_for_weather_api": level_code == "village"
+            }
+            if fuzzy:
+                result["edit_distance"] = distance
+            results.append(result)
 
         if not results:
-            return json.dumps({
+            return dump_json({
                 "message": f"Tidak ditemukan lokasi dengan nama '{location_name}'",
-                "suggestion": "Coba gunakan nama yang lebih spesifik atau cek ejaan",
+                "suggestion": (
+                    "Coba gunakan nama yang lebih spesifik atau cek ejaan"
+                    if fuzzy else
+                    "Coba gunakan nama yang lebih spesifik, cek ejaan, atau gunakan fuzzy=True"
+                ),
                 "searched_in": "base.csv dengan 91,220 wilayah",
                 "results": []
             }, indent=2)
 
-        return json.dumps({
+        return dump_json({
             "query": location_name,
             "admin_level_filter": admin_level,
+            "fuzzy": fuzzy,
             "total_found": len(results),
             "results": results,
+            "next_cursor": next_cursor,
             "note": "Gunakan kode level 'Kelurahan/Desa' (4 segmen) untuk get_weather_forecast()"
         }, indent=2)
 
     except Exception as e:
         return f"Gagal mencari kode wilayah: {str(e)}"
 
-def get_hierarchy(code: str, csv_path: str) -> str:
+def get_hierarchy(code: str) -> str:
     """Helper function untuk mendapatkan hierarki lengkap dari kode wilayah"""
-    parts = code.split('.')
-    hierarchy_parts = []
+    return get_region_index().hierarchy(code)
+
+@mcp.tool()
+@instrumented
+async def get_villages_in_district(district_code: str, limit: int = DEFAULT_PAGE_SIZE, cursor: str = "") -> str:
+    """
+    Mendapatkan daftar kelurahan/desa dalam kecamatan tertentu dari database lokal.
+
+    Args:
+        district_code: Kode kecamatan (contoh: "33.02.07" untuk Sumpiuh)
+        limit: Jumlah maksimal desa per halaman (default: 100, maks. 500)
+        cursor: Nilai "next_cursor" dari halaman sebelumnya; kosongkan untuk halaman pertama
 
-    with open(csv_path, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        csv_data = {row[0].strip(): row[1].strip() for row in reader if len(row) >= 2}
+    Returns:
+        Daftar kelurahan/desa dengan kode lengkap yang siap digunakan untuk prakiraan cuaca,
+        beserta next_cursor bila masih ada halaman berikutnya.
+    """
+    try:
+        if not os.path.exists(CSV_PATH):
+            return dump_json({"error": "File base.csv tidak ditemukan"}, indent=2)
 
-    if len(parts) >= 1:
-        prov_code = parts[0]
-        hierarchy_parts.append(csv_data.get(prov_code, prov_code))
+        index = get_region_index()
+        district_name = index.names.get(district_code)
+
+        if not district_name:
+            return dump_json({
+                "error": f"Kode kecamatan '{district_code}' tidak ditemukan",
+                "suggestion": "Gunakan search_location_code() untuk menemukan kode yang tepat"
+            }, indent=2)
+        if get_code_level(district_code) != 3:
+            return dump_json({
+                "error": f"'{district_code}' bukan kode kecamatan (format: xx.xx.xx)",
+                "suggestion": "Gunakan list_children() untuk wilayah di tingkat lain"
+            }, indent=2)
 
-    if len(parts) >= 2:
-        reg_code = f"{parts[0]}.{parts[1]}"
-        hierarchy_parts.append(csv_data.get(reg_code, reg_code))
+        cursor = cursor.strip()
+        if cursor and not is_descendant_cursor(district_code, 4, cursor):
+            return dump_json({"error": f"Cursor tidak valid: '{cursor}'"}, indent=2)
+        limit = min(max(1, limit), MAX_PAGE_SIZE)
+
+        # Cursor berupa kode desa terakhir: halaman berikutnya dimulai langsung setelahnya
+        page = list(islice(index.iter_descendants(district_code, 4, after=cursor), limit + 1))
+        has_more = len(page) > limit
+        page = page[:limit]
+        villages = [
+            {
+                "code": code,
+                "name": index.names[code],
+                "ready_for_weather_api": True
+            }
+            for code in page
+        ]
 
-    if len(parts) >= 3:
-        dist_code = f"{parts[0]}.{parts[1]}.{parts[2]}"
-        hierarchy_parts.append(csv_data.get(dist_code, dist_code))
+        return dump_json({
+            "district_code": district_code,
+            "district_name": district_name,
+            "total_villages": len(index.get_children(district_code)),
+            "count": len(villages),
+            "villages": villages,
+            "next_cursor": page[-1] if has_more else None,
+            "note": "Gunakan 'code' untuk parameter kode_wilayah di get_weather_forecast()"
+        }, indent=2)
 
-    if len(parts) >= 4:
-        vill_code = code
-        hierarchy_parts.append(csv_data.get(vill_code, vill_code))
+    except Exception as e:
+        return f"Error: {str(e)}"
 
-    return " > ".join(hierarchy_parts)
+def describe_region(index: RegionIndex, code: str) -> dict:
+    """Ringkasan satu kode wilayah untuk output tools browsing"""
+    level_code, level_name = get_admin_level(code)
+    return {
+        "code": code,
+        "name": index.names[code],
+        "level": level_name,
+        "children_count": len(index.get_children(code)),
+        "ready_for_weather_api": level_code == "village"
+    }
 
 @mcp.tool()
-async def get_villages_in_district(district_code: str) -> str:
+@instrumented
+async def get_region(code: str) -> str:
     """
-    Mendapatkan daftar semua kelurahan/desa dalam kecamatan tertentu dari database lokal.
+    Mendapatkan detail satu kode wilayah dari database lokal: nama, level, induk, dan jumlah anak.
 
     Args:
-        district_code: Kode kecamatan (contoh: "33.02.07" untuk Sumpiuh)
+        code: Kode wilayah di level mana pun (contoh: "33", "33.02", "33.02.07", "33.02.07.2005")
 
     Returns:
-        Daftar kelurahan/desa dengan kode lengkap yang siap digunakan untuk prakiraan cuaca.
+        Detail wilayah beserta rantai induknya (provinsi hingga level di atasnya).
     """
     try:
-        csv_path = os.path.join(os.path.dirname(__file__), "base.csv")
+        if not os.path.exists(CSV_PATH):
+            return dump_json({"error": "File base.csv tidak ditemukan"}, indent=2)
+
+        index = get_region_index()
+        code = code.strip()
+        if code not in index.names:
+            return dump_json({
+                "error": f"Kode wilayah '{code}' tidak ditemukan",
+                "suggestion": "Gunakan search_location_code() untuk menemukan kode yang tepat"
+            }, indent=2)
 
-        if not os.path.exists(csv_path):
-            return json.dumps({"error": "File base.csv tidak ditemukan"}, indent=2)
+        ancestors = []
+        parent = index.parent(code)
+        while parent:
+            if parent in index.names:
+                ancestors.append({"code": parent, "name": index.names[parent], "level": get_admin_level(parent)[1]})
+            parent = index.parent(parent)
+        ancestors.reverse()
+
+        return dump_json({
+            **describe_region(index, code),
+            "hierarchy": index.hierarchy(code),
+            "ancestors": ancestors
+        }, indent=2)
 
-        villages = []
-        district_name = None
+    except Exception as e:
+        return f"Gagal mengambil data wilayah: {str(e)}"
 
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if len(row) < 2:
+@mcp.tool()
+@instrumented
+async def list_children(code: str = "", level: str = "", limit: int = DEFAULT_PAGE_SIZE, cursor: str = "") -> str:
+    """
+    Menelusuri hierarki wilayah: daftar anak langsung dari sebuah kode wilayah, atau semua
+    turunannya pada level tertentu (misalnya semua kecamatan dalam satu provinsi).
+
+    Args:
+        code: Kode induk; kosongkan untuk daftar provinsi (contoh: "33" untuk Jawa Tengah)
+        level: Opsional, level turunan yang diambil: "regency"/"kabkota", "district"/"kecamatan",
+               atau "village"/"desa". Kosongkan untuk anak langsung.
+        limit: Jumlah maksimal hasil per halaman (default: 100, maks. 500)
+        cursor: Nilai "next_cursor" dari halaman sebelumnya; kosongkan untuk halaman pertama
+
+    Returns:
+        Daftar wilayah (urut sesuai base.csv) beserta next_cursor bila masih ada halaman berikutnya.
+    """
+    try:
+        if not os.path.exists(CSV_PATH):
+            return dump_json({"error": "File base.csv tidak ditemukan"}, indent=2)
+
+        index = get_region_index()
+        code = code.strip()
+        if code and code not in index.names:
+            return dump_json({
+                "error": f"Kode wilayah '{code}' tidak ditemukan",
+                "suggestion": "Gunakan search_location_code() untuk menemukan kode yang tepat"
+            }, indent=2)
+
+        parent_level = get_code_level(code) if code else 0
+        if level:
+            target_level = ADMIN_LEVEL_FILTERS.get(level)
+            if target_level is None or target_level <= parent_level:
+                return dump_json({
+                    "error": f"Level '{level}' tidak valid untuk kode '{code or 'Indonesia'}'",
+                    "suggestion": "Gunakan level di bawah kode induk: regency/kabkota, district/kecamatan, atau village/desa"
+                }, indent=2)
+        else:
+            target_level = parent_level + 1
+
+        cursor = cursor.strip()
+        if cursor and not is_descendant_cursor(code, target_level, cursor):
+            return dump_json({"error": f"Cursor tidak valid: '{cursor}'"}, indent=2)
+        limit = min(max(1, limit), MAX_PAGE_SIZE)
+
+        # Cursor berupa kode terakhir halaman sebelumnya: iterasi melompat langsung ke cabangnya,
+        # sehingga biaya per halaman sebanding dengan ukuran halaman, bukan posisinya
+        page = list(islice(index.iter_descendants(code, target_level, after=cursor), limit + 1))
+        total = len(index.get_children(code)) if target_level == parent_level + 1 else None
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        result = {
+            "code": code or None,
+            "name": index.names[code] if code else "Indonesia",
+            "level": ADMIN_LEVELS[target_level][1]
+        }
+        if total is not None:
+            result["total"] = total
+        result.update({
+            "count": len(page),
+            "results": [describe_region(index, child) for child in page],
+            "next_cursor": page[-1] if has_more else None
+        })
+        return dump_json(result, indent=2)
+
+    except Exception as e:
+        return f"Gagal menelusuri wilayah: {str(e)}"
+
+def get_forecast_url(kode_wilayah: str) -> str:
+    return f"https://api.bmkg.go.id/publik/prakiraan-cuaca?adm4={kode_wilayah}"
+
+# Koordinat wilayah (lat, lon) yang dikumpulkan dari data lokasi prakiraan cuaca BMKG
+# Tabel centroid kode wilayah (kode,lat,lon), diisi dari field `lokasi` prakiraan cuaca atau file impor
+CENTROIDS_PATH = os.environ.get("BMKG_CENTROIDS_PATH", os.path.join(os.path.dirname(__file__), "centroids.csv"))
+# Ukuran sel grid indeks centroid (derajat, ~11 km)
+CENTROID_GRID_SIZE = 0.1
+# Level dengan centroid sebanyak ini atau kurang dipindai linear (lebih cepat daripada cincin grid yang jarang)
+CENTROID_LINEAR_SCAN = 100
+MAX_NEAREST_RESULTS = 50
+# Centroid baru dikumpulkan selama sekian detik lalu ditambahkan ke centroids.csv sekaligus
+CENTROID_FLUSH_DELAY = 1.0
+
+class CentroidIndex:
+    """
+    Centroid (lat, lon) per kode wilayah beserta grid per level untuk pencarian wilayah terdekat.
+
+    Centroid desa/kelurahan (adm4) berasal dari respons prakiraan cuaca BMKG atau file impor dan
+    disimpan di centroids.csv. Centroid provinsi/kabupaten/kecamatan memakai nilai impor bila ada,
+    selain itu rata-rata centroid desa di dalamnya. Grid dibangun saat level tersebut pertama kali
+    di-query; centroid desa baru langsung disisipkan ke grid yang sudah ada dan hanya centroid
+    rata-rata leluhurnya yang dihitung ulang.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.coordinates: dict[str, tuple[float, float]] = {}
+        self.loaded = False
+        # level -> (centroid per kode, grid sel -> isi sel, batas sel (min_row, min_col, max_row, max_col))
+        self.levels: dict[int, tuple[dict, dict, tuple[int, int, int, int]]] = {}
+        # level < 4 -> kode -> [jumlah lat, jumlah lon, jumlah desa] untuk centroid rata-rata
+        self.sums: dict[int, dict[str, list[float]]] = {}
+        # Baris centroids.csv yang belum ditulis (lihat flush)
+        self.pending: list[tuple[str, float, float]] = []
+        self.flush_task: asyncio.Task | None = None
+
+    @staticmethod
+    def _cell(lat: float, lon: float) -> tuple[int, int]:
+        return (math.floor(lat / CENTROID_GRID_SIZE), math.floor(lon / CENTROID_GRID_SIZE))
+
+    @staticmethod
+    def read_csv(path: str) -> list[tuple[str, float, float]]:
+        """Membaca file centroid (kode,lat,lon); baris header atau tidak valid dilewati"""
+        rows = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if len(row) < 3:
+                    continue
+                try:
+                    rows.append((row[0].strip(), float(row[1]), float(row[2])))
+                except ValueError:
+                    continue
+        return rows
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if os.path.exists(self.path):
+            for code, lat, lon in self.read_csv(self.path):
+                self.coordinates[code] = (lat, lon)
+
+    def get(self, code: str) -> tuple[float, float] | None:
+        self.load()
+        return self.coordinates.get(code)
+
+    def add(self, code: str, lat: float, lon: float, persist: bool = True):
+        """
+        Menyimpan centroid; bila persist, baris baru ditambahkan ke centroids.csv secara
+        berkelompok di thread terpisah (lihat flush)
+        """
+        self.load()
+        previous = self.coordinates.get(code)
+        if previous == (lat, lon):
+            return
+        self.coordinates[code] = (lat, lon)
+        if self.levels:
+            self._update_levels(code, previous, lat, lon)
+        if persist:
+            self.pending.append((code, lat, lon))
+            self._schedule_flush()
+
+    def _update_levels(self, code: str, previous: tuple[float, float] | None, lat: float, lon: float):
+        """Memperbarui grid yang sudah dibangun setelah centroid `code` berubah"""
+        if code not in get_region_index().names:
+            return
+        code_level = get_code_level(code)
+        if code_level != 4:
+            # Centroid impor level atas jarang berubah: level tersebut dibangun ulang saat dipakai
+            self.levels.pop(code_level, None)
+            self.sums.pop(code_level, None)
+            return
+
+        if 4 in self.levels:
+            self._place(4, code, lat, lon)
+        for level, sums in self.sums.items():
+            if level not in self.levels:
+                continue
+            ancestor = '.'.join(code.split('.')[:level])
+            total = sums.get(ancestor)
+            if total is None:
+                if ancestor in self.levels[level][0]:
+                    # Leluhur memakai centroid impor, bukan rata-rata desa
                     continue
+                total = sums[ancestor] = [0.0, 0.0, 0]
+            if previous is not None:
+                total[0] -= previous[0]
+                total[1] -= previous[1]
+                total[2] -= 1
+            total[0] += lat
+            total[1] += lon
+            total[2] += 1
+            self._place(level, ancestor, total[0] / total[2], total[1] / total[2])
+
+    def _place(self, level: int, code: str, lat: float, lon: float):
+        """Memindahkan atau menyisipkan satu centroid pada grid level yang sudah dibangun"""
+        centroids, grid, bounds = self.levels[level]
+        old = centroids.get(code)
+        if old is not None:
+            cell = grid.get(self._cell(*old), [])
+            cell[:] = [entry for entry in cell if entry[3] != code]
+        row, col = self._cell(lat, lon)
+        if not centroids:
+            bounds = (row, col, row, col)
+        centroids[code] = (lat, lon)
+        grid.setdefault((row, col), []).append((*self._unit_vector(lat, lon), code))
+        min_row, min_col, max_row, max_col = bounds
+        self.levels[level] = (centroids, grid, (min(min_row, row), min(min_col, col), max(max_row, row), max(max_col, col)))
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Di luar event loop (mis. perintah CLI): langsung ditulis
+            self.flush()
+            return
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(CENTROID_FLUSH_DELAY)
+        rows, self.pending = self.pending, []
+        await asyncio.to_thread(self._append, rows)
+
+    def flush(self):
+        """Menulis semua centroid yang belum tersimpan (dipanggil juga saat server berhenti)"""
+        rows, self.pending = self.pending, []
+        self._append(rows)
+
+    def _append(self, rows: list[tuple[str, float, float]]):
+        if not rows:
+            return
+        try:
+            with open(self.path, 'a', encoding='utf-8', newline='') as f:
+                csv.writer(f).writerows(rows)
+        except OSError:
+            # Direktori read-only: centroid tetap dipakai dari memori
+            pass
+
+    def save(self):
+        """Menulis ulang centroids.csv dari isi memori (satu baris per kode)"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerows((code, lat, lon) for code, (lat, lon) in sorted(self.coordinates.items()))
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _unit_vector(lat: float, lon: float) -> tuple[float, float, float]:
+        phi, lam = math.radians(lat), math.radians(lon)
+        return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+    def level_centroids(self, level: int) -> tuple[dict[str, tuple[float, float]], dict[tuple[int, int], list[tuple]], tuple]:
+        """
+        Centroid dan grid untuk satu level administratif (dibangun lazy). Isi sel grid berupa
+        (x, y, z, kode) dengan vektor satuan centroid: panjang chord antar vektor satuan naik
+        monoton terhadap jarak great-circle, jadi cukup untuk meranking kandidat tanpa haversine.
+        """
+        cached = self.levels.get(level)
+        if cached is not None:
+            return cached
+
+        self.load()
+        names = get_region_index().names
+        centroids = {}
+        sums: dict[str, list[float]] = {}
+        for code, (lat, lon) in self.coordinates.items():
+            if code not in names:
+                continue
+            code_level = get_code_level(code)
+            if code_level == level:
+                centroids[code] = (lat, lon)
+            elif code_level == 4 and level < 4:
+                ancestor = '.'.join(code.split('.')[:level])
+                total = sums.setdefault(ancestor, [0.0, 0.0, 0])
+                total[0] += lat
+                total[1] += lon
+                total[2] += 1
+        if level < 4:
+            self.sums[level] = {code: total for code, total in sums.items() if code not in centroids}
+        for code, (lat_sum, lon_sum, count) in sums.items():
+            if code not in centroids and code in names:
+                centroids[code] = (lat_sum / count, lon_sum / count)
+
+        grid: dict[tuple[int, int], list[tuple]] = {}
+        for code, (lat, lon) in centroids.items():
+            grid.setdefault(self._cell(lat, lon), []).append((*self._unit_vector(lat, lon), code))
+        rows = [row for row, _ in grid] or [0]
+        cols = [col for _, col in grid] or [0]
+
+        self.levels[level] = (centroids, grid, (min(rows), min(cols), max(rows), max(cols)))
+        return self.levels[level]
+
+    def nearest(self, lat: float, lon: float, level: int, k: int) -> list[tuple[float, str]]:
+        """
+        k kode terdekat pada level tertentu sebagai (jarak_km, kode), terurut dari yang terdekat.
+        Sel grid diperiksa melingkar dari sel titik query dan berhenti begitu cincin berikutnya
+        dipastikan lebih jauh daripada hasil ke-k. Level dengan sedikit centroid dipindai linear.
+        """
+        centroids, grid, (min_row, min_col, max_row, max_col) = self.level_centroids(level)
+        if not grid:
+            return []
+
+        qx, qy, qz = self._unit_vector(lat, lon)
+        # Max-heap (chord kuadrat negatif) berisi k kandidat terbaik sejauh ini
+        best: list[tuple[float, str]] = []
+
+        def scan(entries):
+            for x, y, z, code in entries:
+                chord = (x - qx) ** 2 + (y - qy) ** 2 + (z - qz) ** 2
+                if len(best) < k:
+                    heapq.heappush(best, (-chord, code))
+                elif chord < -best[0][0]:
+                    heapq.heapreplace(best, (-chord, code))
+
+        if len(centroids) <= CENTROID_LINEAR_SCAN:
+            for entries in grid.values():
+                scan(entries)
+        else:
+            center_row, center_col = self._cell(lat, lon)
+            max_ring = max(center_row - min_row, max_row - center_row, center_col - min_col, max_col - center_col)
+            cos_lat = math.cos(math.radians(lat))
+            for ring in range(max_ring + 1):
+                if ring == 0:
+                    scan(grid.get((center_row, center_col), ()))
+                else:
+                    for d_col in range(-ring, ring + 1):
+                        scan(grid.get((center_row - ring, center_col + d_col), ()))
+                        scan(grid.get((center_row + ring, center_col + d_col), ()))
+                    for d_row in range(-ring + 1, ring):
+                        scan(grid.get((center_row + d_row, center_col - ring), ()))
+                        scan(grid.get((center_row + d_row, center_col + ring), ()))
+
+                if len(best) == k:
+                    # Sel di luar cincin ini terpisah lebih dari `ring` sel (lintang atau bujur) dari
+                    # titik query; jarak terpendeknya tidak kurang dari jarak ke meridian sejauh itu
+                    angle = math.asin(min(1.0, cos_lat * math.sin(math.radians(ring * CENTROID_GRID_SIZE))))
+                    if (2 * math.sin(angle / 2)) ** 2 >= -best[0][0]:
+                        break
+
+        return sorted(
+            (2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(-negative) / 2)), code)
+            for negative, code in best
+        )
+
+centroid_index = CentroidIndex(CENTROIDS_PATH)
+
+def remember_region_coordinates(kode_wilayah: str, lokasi: dict):
+    """Helper function untuk menyimpan koordinat dari field `lokasi` respons prakiraan cuaca"""
+    try:
+        lat, lon = float(lokasi['lat']), float(lokasi['lon'])
+    except (KeyError, TypeError, ValueError):
+        return
+    centroid_index.add(kode_wilayah, lat, lon)
+
+async def get_region_coordinates(kode_wilayah: str) -> tuple[float, float] | None:
+    """Koordinat kode wilayah adm4; bila belum diketahui diambil dari API prakiraan cuaca (ter-cache)"""
+    if centroid_index.get(kode_wilayah) is None and get_code_level(kode_wilayah) == 4:
+        try:
+            data = await fetch_cached(get_forecast_url(kode_wilayah), parse_json, "prakiraan-cuaca")
+            remember_region_coordinates(kode_wilayah, data.get('lokasi', {}))
+        except (httpx.HTTPError, ValueError):
+            return None
+    return centroid_index.get(kode_wilayah)
 
-                code = row[0].strip()
-                name = row[1].strip()
+@mcp.tool()
+@instrumented
+async def find_nearest_region(lat: float, lon: float, level: str = "village", k: int = 5) -> str:
+    """
+    Mencari kode wilayah terdekat dari suatu koordinat (reverse geocoding), misalnya untuk
+    episenter gempa atau titik polygon peringatan, tanpa akses jaringan.
 
-                if code == district_code:
-                    district_name = name
+    Args:
+        lat: Lintang (contoh: -7.52)
+        lon: Bujur (contoh: 109.31)
+        level: "village"/"desa" (default), "district"/"kecamatan", "regency"/"kabkota",
+               atau "province"/"provinsi"
+        k: Jumlah wilayah terdekat (default: 5, maks. 50)
 
-                if code.startswith(district_code + ".") and len(code.split('.')) == 4:
-                    villages.append({
-                        "code": code,
-                        "name": name,
-                        "ready_for_weather_api": True
-                    })
+    Returns:
+        Daftar wilayah terdekat dengan jarak ke centroid-nya. Kode level desa dapat langsung
+        digunakan untuk get_weather_forecast().
 
-        if not district_name:
-            return json.dumps({
-                "error": f"Kode kecamatan '{district_code}' tidak ditemukan",
-                "suggestion": "Gunakan search_location_code() untuk menemukan kode yang tepat"
+    Note:
+        Centroid desa dikumpulkan dari respons prakiraan cuaca BMKG (get_weather_forecast,
+        get_weather_forecast_batch) atau diimpor dengan `python bmkg-server.py import-centroids <file>`.
+    """
+    try:
+        level_filter = ADMIN_LEVEL_FILTERS.get(level)
+        if level_filter is None:
+            return dump_json({
+                "error": f"Level tidak dikenal: '{level}'",
+                "suggestion": "Gunakan village/desa, district/kecamatan, regency/kabkota, atau province/provinsi"
             }, indent=2)
+        k = min(max(1, k), MAX_NEAREST_RESULTS)
 
-        return json.dumps({
-            "district_code": district_code,
-            "district_name": district_name,
-            "total_villages": len(villages),
-            "villages": villages,
-            "note": "Gunakan 'code' untuk parameter kode_wilayah di get_weather_forecast()"
+        index = get_region_index()
+        nearest = centroid_index.nearest(lat, lon, level_filter, k)
+        centroids = centroid_index.level_centroids(level_filter)[0]
+
+        if not nearest:
+            return dump_json({
+                "message": "Belum ada centroid wilayah untuk level ini",
+                "suggestion": "Impor file centroid (python bmkg-server.py import-centroids <file>) "
+                              "atau panggil get_weather_forecast untuk desa di sekitar lokasi",
+                "results": []
+            }, indent=2)
+
+        results = []
+        for distance, code in nearest:
+            code_lat, code_lon = centroids[code]
+            level_code, level_name = get_admin_level(code)
+            results.append({
+                "code": code,
+                "name": index.names[code],
+                "level": level_name,
+                "hierarchy": index.hierarchy(code),
+                "lat": round(code_lat, 5),
+                "lon": round(code_lon, 5),
+                "jarak_km": round(distance, 2),
+                "ready_for_weather_api": level_code == "village"
+            })
+
+        return dump_json({
+            "koordinat": f"{lat}, {lon}",
+            "level": ADMIN_LEVELS[level_filter][1],
+            "centroid_coverage": f"{len(centroids)} wilayah dengan centroid",
+            "results": results
         }, indent=2)
 
     except Exception as e:
-        return f"Error: {str(e)}"
+        return f"Gagal mencari wilayah terdekat: {str(e)}"
+
+def get_forecast_days(data: dict) -> list[list[dict]]:
+    """Helper function untuk meratakan data['data'][..]['cuaca'] menjadi daftar forecast mentah per hari"""
+    days = []
+    for day_data in data.get('data') or []:
+        day_forecasts = [
+            forecast
+            for forecast_group in day_data.get('cuaca') or []
+            if isinstance(forecast_group, list)
+            for forecast in forecast_group
+        ]
+        if day_forecasts:
+            days.append(day_forecasts)
+    return days
+
+# Format output get_weather_forecast
+FORECAST_FORMATS = ["verbose", "compact", "summary"]
+
+def build_forecast_columns(days: list[list[dict]]) -> dict:
+    """Helper function format compact: satu array per field, nilai numerik tanpa satuan"""
+    forecasts = [forecast for day_forecasts in days for forecast in day_forecasts]
+    return {
+        "waktu_lokal": [f['local_datetime'] for f in forecasts],
+        "suhu_c": [f['t'] for f in forecasts],
+        "kelembaban_persen": [f['hu'] for f in forecasts],
+        "cuaca": [f['weather_desc'] for f in forecasts],
+        "cuaca_en": [f.get('weather_desc_en', '-') for f in forecasts],
+        "kecepatan_angin_kmj": [f['ws'] for f in forecasts],
+        "arah_angin": [f['wd'] for f in forecasts],
+        "tutupan_awan_persen": [f.get('tcc', 0) for f in forecasts],
+        "jarak_pandang": [f.get('vs_text', '-') for f in forecasts]
+    }
+
+def summarize_forecast_day(day_forecasts: list[dict]) -> dict:
+    """Helper function format summary: ringkasan satu hari (min/max dan kondisi dominan)"""
+    temperatures = [f['t'] for f in day_forecasts]
+    humidities = [f['hu'] for f in day_forecasts]
+    conditions = Counter(f['weather_desc'] for f in day_forecasts)
+    return {
+        "tanggal": day_forecasts[0]['local_datetime'].split()[0],
+        "suhu_min_c": min(temperatures),
+        "suhu_max_c": max(temperatures),
+        "kelembaban_min_persen": min(humidities),
+        "kelembaban_max_persen": max(humidities),
+        "cuaca_dominan": conditions.most_common(1)[0][0],
+        "kecepatan_angin_max_kmj": max(f['ws'] for f in day_forecasts)
+    }
 
 @mcp.tool()
-async def get_weather_forecast(kode_wilayah: str = "31.71.01.1001") -> str:
+@instrumented
+async def get_weather_forecast(kode_wilayah: str = "31.71.01.1001", format: str = "verbose") -> str:
     """
     Mengambil prakiraan cuaca berdasarkan kode wilayah (adm4).
 
     Args:
         kode_wilayah: Kode wilayah Indonesia level desa/kelurahan (adm4).
                      Default: 31.71.01.1001 (Gambir, Jakarta Pusat).
+        format: Format output:
+                - "verbose": daftar forecast lengkap per hari dengan satuan (default)
+                - "compact": satu array per field, nilai numerik tanpa satuan, tanpa indentasi
+                - "summary": ringkasan per hari (suhu/kelembaban min-max, cuaca dominan, angin max)
 
     Returns:
         Prakiraan cuaca 3 hari dengan interval 3 jam (±24 forecast total).
@@ -332,130 +2774,522 @@ async def get_weather_forecast(kode_wilayah: str = "31.71.01.1001") -> str:
         Format kode: [kode_provinsi].[kode_kabkota].[kode_kecamatan].[kode_desa]
         Contoh: 31.71.01.1001 = DKI Jakarta > Jakarta Pusat > Gambir > Gambir
     """
-    url = f"https://api.bmkg.go.id/publik/prakiraan-cuaca?adm4={kode_wilayah}"
+    if format not in FORECAST_FORMATS:
+        format = "verbose"
+
+    url = get_forecast_url(kode_wilayah)
 
-    async with httpx.AsyncClient() as client:
+    try:
         try:
-            response = await client.get(url)
-            if response.status_code != 200:
-                return "Gagal mengambil data cuaca. Cek kode wilayah."
+            data = await fetch_cached(url, parse_json, "prakiraan-cuaca")
+        except httpx.HTTPStatusError:
+            return "Gagal mengambil data cuaca. Cek kode wilayah."
+
+        lokasi = data['lokasi']
+        remember_region_coordinates(kode_wilayah, lokasi)
+        forecast_warmer.record_access(kode_wilayah)
+        info_lokasi = {
+            "provinsi": lokasi['provinsi'],
+            "kabkota": lokasi['kotkab'],
+            "kecamatan": lokasi['kecamatan'],
+            "desa": lokasi['desa'],
+            "koordinat": f"{lokasi['lat']}, {lokasi['lon']}",
+            "timezone": lokasi['timezone']
+        }
+
+        days = get_forecast_days(data)
+
+        if format == "compact":
+            return dump_json({
+                "lokasi": info_lokasi,
+                "total_forecast": sum(len(day_forecasts) for day_forecasts in days),
+                "prakiraan": build_forecast_columns(days),
+                "sumber": BMKG_ATTRIBUTION
+            }, ensure_ascii=False, separators=(',', ':'))
+
+        if format == "summary":
+            return dump_json({
+                "lokasi": info_lokasi,
+                "total_hari": len(days),
+                "ringkasan": [summarize_forecast_day(day_forecasts) for day_forecasts in days],
+                "sumber": BMKG_ATTRIBUTION
+            }, indent=2, ensure_ascii=False)
 
-            data = response.json()
+        forecasts_by_day = []
+
+        for day_forecasts in days:
+            daily_forecasts = []
+            for forecast in day_forecasts:
+                daily_forecasts.append({
+                    "waktu_lokal": forecast['local_datetime'],
+                    "waktu_utc": forecast['utc_datetime'],
+                    "suhu": f"{forecast['t']}°C",
+                    "kelembaban": f"{forecast['hu']}%",
+                    "cuaca": forecast['weather_desc'],
+                    "cuaca_en": forecast.get('weather_desc_en', '-'),
+                    "kecepatan_angin": f"{forecast['ws']} km/j",
+                    "arah_angin": forecast['wd'],
+                    "tutupan_awan": f"{forecast.get('tcc', 0)}%",
+                    "jarak_pandang": forecast.get('vs_text', '-'),
+                    "icon": forecast.get('image', '-')
+                })
+
+            forecasts_by_day.append({
+                "tanggal": daily_forecasts[0]['waktu_lokal'].split()[0],
+                "jumlah_forecast": len(daily_forecasts),
+                "forecasts": daily_forecasts
+            })
+
+        result = {
+            "lokasi": info_lokasi,
+            "total_hari": len(forecasts_by_day),
+            "total_forecast": sum(day['jumlah_forecast'] for day in forecasts_by_day),
+            "prakiraan": forecasts_by_day,
+            "catatan": "Data prakiraan 3 hari dengan interval 3 jam (8 forecast per hari)",
+            "sumber": BMKG_ATTRIBUTION
+        }
+
+        return dump_json(result, indent=2, ensure_ascii=False)
 
-            lokasi = data['lokasi']
-            info_lokasi = {
-                "provinsi": lokasi['provinsi'],
-                "kabkota": lokasi['kotkab'],
-                "kecamatan": lokasi['kecamatan'],
-                "desa": lokasi['desa'],
-                "koordinat": f"{lokasi['lat']}, {lokasi['lon']}",
-                "timezone": lokasi['timezone']
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+# Batas tool prakiraan cuaca batch: jumlah kode per panggilan dan request paralel ke BMKG
+FORECAST_BATCH_MAX_CODES = int(os.environ.get("BMKG_FORECAST_BATCH_MAX_CODES", "100"))
+FORECAST_BATCH_CONCURRENCY = int(os.environ.get("BMKG_FORECAST_BATCH_CONCURRENCY", "5"))
+
+# Kolom tiap baris prakiraan pada output batch
+FORECAST_BATCH_COLUMNS = ["waktu_lokal", "suhu_c", "kelembaban_persen", "cuaca", "kecepatan_angin_kmj", "arah_angin"]
+
+def resolve_forecast_codes(codes: list[str] | None, district_code: str) -> tuple[list[str], dict | None]:
+    """
+    Helper function tool batch: kode adm4 unik dari `codes` ditambah semua desa/kelurahan di
+    `district_code`. Mengembalikan (kode, None) atau ([], dict error untuk output tool).
+
+    Batas FORECAST_BATCH_MAX_CODES hanya berlaku untuk `codes`; desa dari `district_code` selalu
+    diambil semua (kecamatan terbesar di base.csv berisi 108 desa) agar kecamatan mana pun bisa dipakai.
+    """
+    requested = list(dict.fromkeys(code.strip() for code in codes or [] if code.strip()))
+    if len(requested) > FORECAST_BATCH_MAX_CODES:
+        return [], {"error": f"Maksimal {FORECAST_BATCH_MAX_CODES} kode per panggilan, diminta {len(requested)}"}
+    if district_code:
+        index = get_region_index()
+        if district_code not in index.names:
+            return [], {
+                "error": f"Kode kecamatan '{district_code}' tidak ditemukan",
+                "suggestion": "Gunakan search_location_code() untuk menemukan kode yang tepat"
             }
+        if get_code_level(district_code) != 3:
+            # Kode kabupaten/provinsi akan menarik ribuan desa tanpa batas
+            return [], {"error": f"'{district_code}' bukan kode kecamatan (format: xx.xx.xx)"}
+        requested.extend(index.iter_descendants(district_code, 4))
+
+    # Kode duplikat hanya diambil sekali
+    unique_codes = list(dict.fromkeys(requested))
+    if not unique_codes:
+        return [], {"error": "Isi codes atau district_code"}
+    return unique_codes, None
+
+async def fetch_forecasts(codes: list[str], build) -> list[dict]:
+    """
+    Helper function tool batch: mengambil prakiraan banyak kode (paralel terbatas, lewat cache)
+    lalu memanggil build(kode, data) per kode. Kode yang gagal menjadi {"kode", "error"} tanpa
+    menggagalkan kode lain; urutan hasil sesuai urutan input.
+    """
+    semaphore = asyncio.Semaphore(FORECAST_BATCH_CONCURRENCY)
 
-            forecasts_by_day = []
-
-            if 'data' in data and len(data['data']) > 0:
-                for day_data in data['data']:
-                    daily_forecasts = []
-
-                    if 'cuaca' in day_data and len(day_data['cuaca']) > 0:
-                        for forecast_group in day_data['cuaca']:
-                            if isinstance(forecast_group, list):
-                                for forecast in forecast_group:
-                                    daily_forecasts.append({
-                                        "waktu_lokal": forecast['local_datetime'],
-                                        "waktu_utc": forecast['utc_datetime'],
-                                        "suhu": f"{forecast['t']}°C",
-                                        "kelembaban": f"{forecast['hu']}%",
-                                        "cuaca": forecast['weather_desc'],
-                                        "cuaca_en": forecast.get('weather_desc_en', '-'),
-                                        "kecepatan_angin": f"{forecast['ws']} km/j",
-                                        "arah_angin": forecast['wd'],
-                                        "tutupan_awan": f"{forecast.get('tcc', 0)}%",
-                                        "jarak_pandang": forecast.get('vs_text', '-'),
-                                        "icon": forecast.get('image', '-')
-                                    })
-
-                    if daily_forecasts:
-                        forecasts_by_day.append({
-                            "tanggal": daily_forecasts[0]['waktu_lokal'].split()[0],
-                            "jumlah_forecast": len(daily_forecasts),
-                            "forecasts": daily_forecasts
-                        })
+    async def fetch_one(code: str) -> dict:
+        try:
+            async with semaphore:
+                data = await fetch_cached(get_forecast_url(code), parse_json, "prakiraan-cuaca")
+            remember_region_coordinates(code, data['lokasi'])
+            forecast_warmer.record_access(code)
+            return build(code, data)
+        except httpx.HTTPStatusError as e:
+            return {"kode": code, "error": f"HTTP {e.response.status_code}, cek kode wilayah"}
+        except Exception as e:
+            return {"kode": code, "error": str(e) or type(e).__name__}
+
+    return await asyncio.gather(*(fetch_one(code) for code in codes))
+
+def build_batch_forecast(code: str, data: dict) -> dict:
+    lokasi = data['lokasi']
+    return {
+        "kode": code,
+        "desa": lokasi.get('desa', '-'),
+        "kecamatan": lokasi.get('kecamatan', '-'),
+        "koordinat": [lokasi.get('lat'), lokasi.get('lon')],
+        "prakiraan": [
+            [f['local_datetime'], f['t'], f['hu'], f['weather_desc'], f['ws'], f['wd']]
+            for day_forecasts in get_forecast_days(data) for f in day_forecasts
+        ]
+    }
 
-            result = {
-                "lokasi": info_lokasi,
-                "total_hari": len(forecasts_by_day),
-                "total_forecast": sum(day['jumlah_forecast'] for day in forecasts_by_day),
-                "prakiraan": forecasts_by_day,
-                "catatan": "Data prakiraan 3 hari dengan interval 3 jam (8 forecast per hari)",
-                "sumber": BMKG_ATTRIBUTION
+@mcp.tool()
+@instrumented
+async def get_weather_forecast_batch(codes: list[str] | None = None, district_code: str = "") -> str:
+    """
+    Mengambil prakiraan cuaca untuk banyak kode wilayah (adm4) sekaligus dalam format ringkas.
+    Cocok untuk dashboard, misalnya semua desa/kelurahan dalam satu kecamatan.
+
+    Args:
+        codes: Daftar kode wilayah level desa/kelurahan (contoh: ["33.02.07.2005", "33.02.07.1013"])
+        district_code: Kode kecamatan; jika diisi, semua desa/kelurahan di kecamatan tersebut
+                       ikut diambil (contoh: "33.02.07")
+
+    Returns:
+        Prakiraan per kode dengan baris ringkas sesuai urutan kolom di "kolom".
+        Kode yang gagal diambil dicantumkan dengan pesan error tanpa menggagalkan kode lain.
+
+    Sumber Data: BMKG (Badan Meteorologi, Klimatologi, dan Geofisika)
+    """
+    try:
+        unique_codes, error = resolve_forecast_codes(codes, district_code)
+        if error is not None:
+            return dump_json(error, indent=2)
+
+        results = await fetch_forecasts(unique_codes, build_batch_forecast)
+        total_errors = sum(1 for result in results if "error" in result)
+
+        return dump_json({
+            "total_kode": len(results),
+            "total_gagal": total_errors,
+            "kolom": FORECAST_BATCH_COLUMNS,
+            "data": results,
+            "sumber": BMKG_ATTRIBUTION
+        }, ensure_ascii=False, separators=(',', ':'))
+
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+# Kode cuaca BMKG mulai 60 adalah hujan (60 ringan, 61 sedang, 63 lebat, 80 lokal, 95/97 petir)
+RAIN_WEATHER_CODE = 60
+
+def aggregate_forecast_days(forecasts: list[tuple[str, dict]]) -> list[dict]:
+    """
+    Helper function get_weather_forecast_stats: statistik per tanggal lokal atas slot 3 jam
+    semua lokasi. Nilai tiap tanggal dikumpulkan per kolom lalu dihitung dengan min/max/sum.
+    """
+    multiple = len(forecasts) > 1
+    names = {code: data['lokasi'].get('desa', '-') for code, data in forecasts}
+    columns: dict[str, dict[str, list]] = {}
+    for code, data in forecasts:
+        for day_forecasts in get_forecast_days(data):
+            date = day_forecasts[0]['local_datetime'][:10]
+            day = columns.get(date)
+            if day is None:
+                day = columns[date] = {"t": [], "hu": [], "ws": [], "tp": [], "weather": [], "desc": [], "kode": []}
+            day["t"].extend(f['t'] for f in day_forecasts)
+            day["hu"].extend(f['hu'] for f in day_forecasts)
+            day["ws"].extend(f['ws'] for f in day_forecasts)
+            day["tp"].extend(f.get('tp') or 0 for f in day_forecasts)
+            day["weather"].extend(f.get('weather', 0) for f in day_forecasts)
+            day["desc"].extend(f['weather_desc'] for f in day_forecasts)
+            day["kode"].extend(code for _ in day_forecasts)
+
+    days = []
+    for date, day in sorted(columns.items()):
+        temperatures, humidities = day["t"], day["hu"]
+        slots = len(temperatures)
+        rain = [weather >= RAIN_WEATHER_CODE for weather in day["weather"]]
+        # Curah hujan dijumlahkan per lokasi; untuk banyak lokasi dilaporkan yang terbesar
+        precipitation = Counter()
+        for code, amount in zip(day["kode"], day["tp"]):
+            precipitation[code] += amount
+        stats = {
+            "tanggal": date,
+            "suhu_min_c": min(temperatures),
+            "suhu_max_c": max(temperatures),
+            "suhu_rata_c": round(sum(temperatures) / slots, 1),
+            "kelembaban_min_persen": min(humidities),
+            "kelembaban_max_persen": max(humidities),
+            "kelembaban_rata_persen": round(sum(humidities) / slots),
+            "slot_hujan": sum(rain),
+            "persen_slot_hujan": round(100 * sum(rain) / slots),
+            "curah_hujan_mm": round(max(precipitation.values()), 1),
+            "cuaca_dominan": Counter(day["desc"]).most_common(1)[0][0],
+            "kecepatan_angin_max_kmj": max(day["ws"])
+        }
+        if multiple:
+            stats["lokasi_hujan"] = len({code for code, is_rain in zip(day["kode"], rain) if is_rain})
+            for key, value in (("suhu_max_di", stats["suhu_max_c"]), ("suhu_min_di", stats["suhu_min_c"])):
+                code = day["kode"][temperatures.index(value)]
+                stats[key] = f"{code} - {names[code]}"
+        days.append(stats)
+    return days
+
+@mcp.tool()
+@instrumented
+async def get_weather_forecast_stats(
+    kode_wilayah: str = "",
+    codes: list[str] | None = None,
+    district_code: str = ""
+) -> str:
+    """
+    Statistik prakiraan cuaca per hari yang dihitung di server, untuk satu kode wilayah atau
+    gabungan banyak kode (misalnya satu kecamatan). Jauh lebih ringkas daripada
+    get_weather_forecast untuk pertanyaan seperti "besok hujan tidak?" atau
+    "suhu tertinggi minggu ini di kecamatan X".
+
+    Args:
+        kode_wilayah: Kode wilayah level desa/kelurahan (adm4), contoh: "31.71.01.1001"
+        codes: Daftar kode adm4 tambahan yang digabung dalam statistik
+        district_code: Kode kecamatan; semua desa/kelurahan di dalamnya ikut digabung (contoh: "33.02.07")
+
+    Returns:
+        Per tanggal: suhu dan kelembaban min/max/rata-rata, jumlah dan persentase slot 3 jam
+        dengan kondisi hujan, curah hujan (mm), cuaca dominan, dan kecepatan angin maksimum.
+        Untuk banyak kode juga jumlah lokasi yang diprakirakan hujan serta kode lokasi
+        dengan suhu tertinggi/terendah.
+
+    Sumber Data: BMKG (Badan Meteorologi, Klimatologi, dan Geofisika)
+    """
+    try:
+        if not (kode_wilayah or codes or district_code):
+            return dump_json({"error": "Isi kode_wilayah, codes, atau district_code"}, indent=2)
+        unique_codes, error = resolve_forecast_codes([kode_wilayah, *(codes or [])], district_code)
+        if error is not None:
+            return dump_json(error, indent=2)
+
+        results = await fetch_forecasts(unique_codes, lambda code, data: {"kode": code, "data": data})
+        forecasts = [(result["kode"], result["data"]) for result in results if "data" in result]
+        failed = [result for result in results if "error" in result]
+        if not forecasts:
+            return dump_json({"error": "Gagal mengambil data cuaca. Cek kode wilayah.", "gagal": failed}, indent=2, ensure_ascii=False)
+
+        if len(forecasts) == 1:
+            lokasi = forecasts[0][1]['lokasi']
+            info_lokasi = {
+                "kode": forecasts[0][0],
+                "desa": lokasi.get('desa', '-'),
+                "kecamatan": lokasi.get('kecamatan', '-'),
+                "kabkota": lokasi.get('kotkab', '-'),
+                "provinsi": lokasi.get('provinsi', '-')
             }
+        else:
+            info_lokasi = {"total_kode": len(forecasts)}
+            if district_code:
+                info_lokasi["kode_kecamatan"] = district_code
+                info_lokasi["kecamatan"] = get_region_index().names[district_code]
+
+        result = {"lokasi": info_lokasi, "hari": aggregate_forecast_days(forecasts)}
+        if failed:
+            result["gagal"] = failed
+        result["sumber"] = BMKG_ATTRIBUTION
+        return dump_json(result, ensure_ascii=False, separators=(',', ':'))
+
+    except Exception as e:
+        return f"Error: {str(e)}"
 
-            return json.dumps(result, indent=2, ensure_ascii=False)
+# ---------------------------------------------------------------------------
+# Warming prakiraan cuaca untuk kode wilayah populer
+# ---------------------------------------------------------------------------
+
+# Kode adm4 yang selalu dijaga tetap ada di cache (dipisah koma), hanya bila prefetch aktif
+FORECAST_WARM_CODES = [
+    code.strip() for code in os.environ.get("BMKG_FORECAST_WARM_CODES", "").split(",") if code.strip()
+]
+# Jumlah kode paling sering diminta yang ikut dijaga hangat (dipelajari dari jumlah akses), 0 untuk menonaktifkan
+FORECAST_WARM_TOP = int(os.environ.get("BMKG_FORECAST_WARM_TOP", "100"))
+# Interval pengecekan scheduler (detik); 0 (default) = prefetch nonaktif
+FORECAST_PREFETCH_INTERVAL = float(os.environ.get("BMKG_FORECAST_PREFETCH_INTERVAL", "0"))
+# Entry diperbarui sekitar sekian detik sebelum kedaluwarsa (0.5x-1.5x per kode agar tersebar)
+FORECAST_PREFETCH_LEAD = float(os.environ.get("BMKG_FORECAST_PREFETCH_LEAD", "120"))
+# Jumlah maksimal kode yang diperbarui per pengecekan, agar request ke BMKG tersebar
+FORECAST_PREFETCH_PER_TICK = 10
+# Jumlah akses dibagi dua setiap interval ini (detik) sehingga daftar populer mengikuti tren terbaru
+FORECAST_ACCESS_HALF_LIFE = 3600
+
+class ForecastWarmer:
+    """
+    Menjaga prakiraan cuaca kode populer tetap segar di cache: kode dari FORECAST_WARM_CODES
+    ditambah FORECAST_WARM_TOP kode yang paling sering diminta. Setiap pengecekan, kode yang
+    akan kedaluwarsa dalam lead-nya diperbarui, paling banyak FORECAST_PREFETCH_PER_TICK kode.
+    """
 
-        except Exception as e:
-            return f"Error: {str(e)}"
+    def __init__(self, codes: list[str], top: int):
+        self.codes = list(dict.fromkeys(codes))
+        self.top = top
+        self.access: Counter = Counter()
+        self.decayed_at = time.monotonic()
+        # Kode yang gagal diperbarui (misalnya kode tidak valid) dicoba lagi setelah waktu ini
+        self.retry_at: dict[str, float] = {}
+
+    def record_access(self, code: str):
+        if self.top > 0:
+            self.access[code] += 1
+
+    def decay(self, now: float):
+        if now - self.decayed_at < FORECAST_ACCESS_HALF_LIFE:
+            return
+        self.decayed_at = now
+        # Sekaligus membatasi ukuran counter; kode yang jarang diminta dibuang
+        self.access = Counter({
+            code: count // 2 for code, count in self.access.most_common(self.top * 4) if count >= 2
+        })
+
+    def warm_codes(self) -> list[str]:
+        return list(dict.fromkeys([*self.codes, *(code for code, _ in self.access.most_common(self.top))]))
+
+    @staticmethod
+    def lead(code: str) -> float:
+        """Lead refresh per kode, tetap untuk kode yang sama, antara 0.5x dan 1.5x FORECAST_PREFETCH_LEAD"""
+        fraction = int.from_bytes(hashlib.md5(code.encode()).digest()[:2]) / 0xFFFF
+        return FORECAST_PREFETCH_LEAD * (0.5 + fraction)
+
+    def due(self, now: float) -> list[str]:
+        """Kode yang perlu diperbarui, yang paling cepat kedaluwarsa lebih dulu"""
+        due = []
+        for code in self.warm_codes():
+            if self.retry_at.get(code, 0) > now:
+                continue
+            entry = response_cache.entries.get(get_forecast_url(code))
+            expires_at = entry.expires_at if entry is not None else -math.inf
+            if expires_at - now < self.lead(code):
+                due.append((expires_at, code))
+        due.sort()
+        return [code for _, code in due[:FORECAST_PREFETCH_PER_TICK]]
+
+    async def refresh(self, code: str):
+        try:
+            await prefetch(get_forecast_url(code), parse_json, "prakiraan-cuaca", self.lead(code))
+        except Exception:
+            self.retry_at[code] = time.monotonic() + FORECAST_PREFETCH_LEAD
+            raise
+        self.retry_at.pop(code, None)
+
+    async def tick(self):
+        """Satu pengecekan; error pertama dari kode yang gagal diteruskan agar dihitung run_background_job"""
+        now = time.monotonic()
+        self.decay(now)
+        results = await asyncio.gather(*(self.refresh(code) for code in self.due(now)), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        codes = []
+        for code in self.warm_codes():
+            entry = response_cache.entries.get(get_forecast_url(code))
+            codes.append({
+                "kode": code,
+                "akses": self.access.get(code, 0),
+                "kedaluwarsa_dalam": round(entry.expires_at - now) if entry is not None else None
+            })
+        return {
+            "configured": self.codes,
+            "top": self.top,
+            "interval": FORECAST_PREFETCH_INTERVAL,
+            "lead": FORECAST_PREFETCH_LEAD,
+            "codes": codes
+        }
+
+# Tanpa prefetch, jumlah akses tidak dicatat (dan tidak pernah di-decay oleh tick)
+forecast_warmer = ForecastWarmer(FORECAST_WARM_CODES, FORECAST_WARM_TOP if FORECAST_PREFETCH_INTERVAL > 0 else 0)
+
+async def warm_forecasts():
+    """Job background: scheduler prefetch prakiraan cuaca kode populer"""
+    await run_background_job("warm_forecasts", FORECAST_PREFETCH_INTERVAL, forecast_warmer.tick)
+
+if FORECAST_PREFETCH_INTERVAL > 0:
+    BACKGROUND_JOBS.append(warm_forecasts)
+
+@mcp.resource("bmkg://stats/forecast-warm", mime_type="application/json")
+def get_forecast_warm_stats() -> str:
+    """Daftar kode prakiraan cuaca yang dijaga hangat beserta jumlah akses dan sisa TTL (detik)"""
+    return dump_json(forecast_warmer.snapshot(), indent=2)
 
 @mcp.tool()
-async def get_weather_alerts(language: str = "id") -> str:
+@instrumented
+async def get_weather_alerts(language: str = "id", limit: int = DEFAULT_PAGE_SIZE, cursor: str = "") -> str:
     """
     Mengambil peringatan dini cuaca ekstrem (hujan lebat/petir) yang sedang aktif di Indonesia.
     Data berbasis Common Alerting Protocol (CAP) hingga level kecamatan.
 
     Args:
         language: Bahasa output, "id" untuk Indonesia atau "en" untuk English (default: "id")
+        limit: Jumlah maksimal peringatan per halaman (default: 100, maks. 500)
+        cursor: Nilai "next_cursor" dari halaman sebelumnya; kosongkan untuk halaman pertama
 
     Returns:
         Daftar peringatan dini cuaca aktif dengan informasi provinsi terdampak,
-        waktu publikasi, deskripsi wilayah, dan tautan detail CAP.
+        waktu publikasi, deskripsi wilayah, dan tautan detail CAP, beserta next_cursor
+        bila masih ada halaman berikutnya.
     """
     if language not in ["id", "en"]:
         language = "id"
 
     url = f"https://www.bmkg.go.id/alerts/nowcast/{language}"
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url)
-            data = xmltodict.parse(response.content)
-
-            alerts = []
-            channel = data.get('rss', {}).get('channel', {})
+    try:
+        offset = parse_offset_cursor(cursor)
+    except ValueError:
+        return dump_json({"error": f"Cursor tidak valid: '{cursor}'"}, indent=2)
+    limit = min(max(1, limit), MAX_PAGE_SIZE)
 
-            metadata = {
-                "last_build_date": channel.get('lastBuildDate', '-'),
-                "title": channel.get('title', 'BMKG Weather Alerts'),
-                "language": language
+    try:
+        feed = await fetch_cached(url, parse_nowcast_xml, "nowcast")
+
+        alerts = []
+
+        metadata = {
+            "last_build_date": feed.last_build_date,
+            "title": feed.title,
+            "language": language
+        }
+
+        for item in feed.items[offset:offset + limit]:
+            alert = {
+                "title": item.title,
+                "link": item.link,  # Tautan detail CAP provinsi
+                "description": item.description,
+                "author": item.author,  # Pembuat rilis
+                "pub_date": item.pub_date  # Waktu publikasi lokal (RFC 1123)
             }
+            alerts.append(alert)
 
-            items = channel.get('item', [])
+        result = {
+            "metadata": metadata,
+            "total_alerts": len(feed.items),
+            "count": len(alerts),
+            "alerts": alerts,
+            # Posisi dalam feed; feed yang berubah di antara halaman dapat menggeser urutan
+            "next_cursor": str(offset + limit) if offset + limit < len(feed.items) else None
+        }
 
-            if isinstance(items, dict):
-                items = [items]
+        return dump_json(result, indent=2)
 
-            for item in items:
-                alert = {
-                    "title": item.get('title', '-'),
-                    "link": item.get('link', '-'),  # Tautan detail CAP provinsi
-                    "description": item.get('description', '-'),
-                    "author": item.get('author', '-'),  # Pembuat rilis
-                    "pub_date": item.get('pubDate', '-')  # Waktu publikasi lokal (RFC 1123)
-                }
-                alerts.append(alert)
+    except Exception as e:
+        return f"Gagal mengambil peringatan dini: {str(e)}"
 
-            result = {
-                "metadata": metadata,
-                "total_alerts": len(alerts),
-                "alerts": alerts
-            }
+# Batas request CAP paralel dan timeout per dokumen CAP (detik)
+CAP_FETCH_CONCURRENCY = int(os.environ.get("BMKG_CAP_CONCURRENCY", "8"))
+CAP_FETCH_TIMEOUT = float(os.environ.get("BMKG_CAP_TIMEOUT", "5"))
 
-            return json.dumps(result, indent=2)
+def get_cap_url(cap_code: str, language: str) -> str:
+    return f"https://www.bmkg.go.id/alerts/nowcast/{language}/{cap_code}_alert.xml"
 
-        except Exception as e:
-            return f"Gagal mengambil peringatan dini: {str(e)}"
+async def fetch_cap_documents(cap_codes: list[str], language: str) -> list[tuple]:
+    """
+    Mengambil banyak dokumen CAP secara paralel (dibatasi semaphore dan timeout per request).
+    Mengembalikan [(cap_code, data atau exception)] sesuai urutan input, sehingga kegagalan
+    satu dokumen tidak menggagalkan yang lain.
+    """
+    semaphore = asyncio.Semaphore(CAP_FETCH_CONCURRENCY)
+
+    async def fetch_one(cap_code: str):
+        async with semaphore:
+            return await asyncio.wait_for(
+                fetch_cached(get_cap_url(cap_code, language), parse_xml, "cap"),
+                CAP_FETCH_TIMEOUT
+            )
+
+    results = await asyncio.gather(*(fetch_one(code) for code in cap_codes), return_exceptions=True)
+    return list(zip(cap_codes, results))
 
 @mcp.tool()
+@instrumented
 async def get_weather_alert_detail(cap_code: str, language: str = "id") -> str:
     """
     Mengambil detail peringatan dini cuaca untuk provinsi tertentu berdasarkan CAP code.
@@ -472,52 +3306,51 @@ async def get_weather_alert_detail(cap_code: str, language: str = "id") -> str:
     if language not in ["id", "en"]:
         language = "id"
 
-    url = f"https://www.bmkg.go.id/alerts/nowcast/{language}/{cap_code}_alert.xml"
+    url = get_cap_url(cap_code, language)
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url)
-            data = xmltodict.parse(response.content)
-
-            alert = data.get('alert', {})
-            info = alert.get('info', {})
-
-            if isinstance(info, list):
-                info = info[0]  # Ambil info pertama
-
-            result = {
-                "identifier": alert.get('identifier', '-'),
-                "sender": alert.get('sender', '-'),
-                "sent": alert.get('sent', '-'),
-                "status": alert.get('status', '-'),
-                "msg_type": alert.get('msgType', '-'),
-                "event": info.get('event', '-'),
-                "effective": info.get('effective', '-'),
-                "expires": info.get('expires', '-'),
-                "sender_name": info.get('senderName', '-'),
-                "headline": info.get('headline', '-'),
-                "description": info.get('description', '-'),
-                "web": info.get('web', '-'),  # Tautan infografik
-                "areas": []
+    try:
+        data = await fetch_cached(url, parse_xml, "cap")
+
+        alert = data.get('alert', {})
+        info = alert.get('info', {})
+
+        if isinstance(info, list):
+            info = info[0]  # Ambil info pertama
+
+        result = {
+            "identifier": alert.get('identifier', '-'),
+            "sender": alert.get('sender', '-'),
+            "sent": alert.get('sent', '-'),
+            "status": alert.get('status', '-'),
+            "msg_type": alert.get('msgType', '-'),
+            "event": info.get('event', '-'),
+            "effective": info.get('effective', '-'),
+            "expires": info.get('expires', '-'),
+            "sender_name": info.get('senderName', '-'),
+            "headline": info.get('headline', '-'),
+            "description": info.get('description', '-'),
+            "web": info.get('web', '-'),  # Tautan infografik
+            "areas": []
+        }
+
+        areas = info.get('area', [])
+        if isinstance(areas, dict):
+            areas = [areas]
+
+        for area in areas:
+            area_info = {
+                "area_desc": area.get('areaDesc', '-'),
+                "polygon": area.get('polygon', '-')  # Polygon wilayah terdampak
             }
+            result["areas"].append(area_info)
 
-            areas = info.get('area', [])
-            if isinstance(areas, dict):
-                areas = [areas]
-
-            for area in areas:
-                area_info = {
-                    "area_desc": area.get('areaDesc', '-'),
-                    "polygon": area.get('polygon', '-')  # Polygon wilayah terdampak
-                }
-                result["areas"].append(area_info)
-
-            return json.dumps(result, indent=2)
+        return dump_json(result, indent=2)
 
-        except Exception as e:
-            return f"Gagal mengambil detail CAP: {str(e)}"
+    except Exception as e:
+        return f"Gagal mengambil detail CAP: {str(e)}"
 
 @mcp.tool()
+@instrumented
 async def search_weather_alerts_by_kecamatan(kecamatan: str, language: str = "id") -> str:
     """
     Mencari peringatan dini cuaca yang aktif untuk kecamatan tertentu.
@@ -536,87 +3369,661 @@ async def search_weather_alerts_by_kecamatan(kecamatan: str, language: str = "id
 
     url_rss = f"https://www.bmkg.go.id/alerts/nowcast/{language}"
 
-    async with httpx.AsyncClient() as client:
+    try:
+        feed = await fetch_cached(url_rss, parse_nowcast_xml, "nowcast")
+
+        if not feed.items:
+            return dump_json({"message": "Tidak ada peringatan aktif saat ini", "alerts": []}, indent=2)
+
+        cap_codes = get_cap_codes(feed)
+
+        matching_alerts = []
+        failed_cap_codes = []
+
+        for cap_code, cap_data in await fetch_cap_documents(cap_codes, language):
+            if isinstance(cap_data, BaseException):
+                failed_cap_codes.append(cap_code)
+                continue
+
+            try:
+                alert_detail = cap_data.get('alert', {})
+                info = alert_detail.get('info', {})
+
+                if isinstance(info, list):
+                    info = info[0]
+
+                areas = info.get('area', [])
+                if isinstance(areas, dict):
+                    areas = [areas]
+
+                affected_areas = []
+                kecamatan_found = False
+
+                for area in areas:
+                    area_desc = area.get('areaDesc', '')
+
+                    if kecamatan.lower() in area_desc.lower():
+                        kecamatan_found = True
+                        affected_areas.append({
+                            "area_desc": area_desc,
+                            "polygon": area.get('polygon', '-')
+                        })
+
+                if kecamatan_found:
+                    matching_alerts.append({
+                        "headline": info.get('headline', '-'),
+                        "event": info.get('event', '-'),
+                        "effective": info.get('effective', '-'),
+                        "expires": info.get('expires', '-'),
+                        "severity": info.get('severity', '-'),
+                        "certainty": info.get('certainty', '-'),
+                        "urgency": info.get('urgency', '-'),
+                        "description": info.get('description', '-'),
+                        "web": info.get('web', '-'),
+                        "affected_areas": affected_areas,
+                        "cap_code": cap_code
+                    })
+
+            except Exception:
+                failed_cap_codes.append(cap_code)
+
+        result = {
+            "kecamatan_searched": kecamatan,
+            "total_matching_alerts": len(matching_alerts),
+            "alerts": matching_alerts
+        }
+
+        if failed_cap_codes:
+            # Hasil parsial: sebagian dokumen CAP gagal diambil atau timeout
+            result["partial"] = True
+            result["failed_cap_codes"] = failed_cap_codes
+
+        if len(matching_alerts) == 0:
+            result["message"] = f"Tidak ada peringatan aktif untuk kecamatan '{kecamatan}'"
+
+        return dump_json(result, indent=2)
+
+    except Exception as e:
+        return f"Gagal mencari peringatan untuk kecamatan: {str(e)}"
+
+# ---------------------------------------------------------------------------
+# Indeks spasial peringatan dini (polygon CAP)
+# ---------------------------------------------------------------------------
+
+# Interval pembaruan indeks peringatan di background (detik); 0 = nonaktif, indeks dibangun saat dibutuhkan
+ALERT_INDEX_INTERVAL = float(os.environ.get("BMKG_ALERT_INDEX_INTERVAL", "0"))
+# Ukuran sel grid indeks spasial (derajat)
+ALERT_GRID_SIZE = 0.25
+
+def parse_cap_polygon(polygon: str) -> list[tuple[float, float]]:
+    """Helper function untuk mengubah polygon CAP ("lat,lon lat,lon ...") menjadi daftar (lat, lon)"""
+    points = []
+    for pair in polygon.split():
+        lat, _, lon = pair.partition(',')
+        points.append((float(lat), float(lon)))
+    return points
+
+def point_in_polygon(lat: float, lon: float, points: list[tuple[float, float]]) -> bool:
+    """Helper function ray casting: apakah titik (lat, lon) berada di dalam polygon"""
+    inside = False
+    j = len(points) - 1
+    for i in range(len(points)):
+        lat_i, lon_i = points[i]
+        lat_j, lon_j = points[j]
+        if (lat_i > lat) != (lat_j > lat):
+            if lon < (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i:
+                inside = not inside
+        j = i
+    return inside
+
+class AlertIndex:
+    """
+    Indeks spasial polygon area peringatan CAP yang aktif.
+
+    Setiap polygon didaftarkan ke sel-sel grid yang dicakup bounding box-nya, sehingga
+    query titik cukup memeriksa polygon di satu sel (cek bounding box lalu point-in-polygon).
+    """
+
+    def __init__(self, language: str):
+        self.language = language
+        self.updated_at: datetime | None = None
+        self.alerts: list[dict] = []
+        # (indeks alert, area_desc, bounding box, titik polygon)
+        self.polygons: list[tuple] = []
+        self.grid: dict[tuple[int, int], list[int]] = {}
+
+    @staticmethod
+    def _cell(lat: float, lon: float) -> tuple[int, int]:
+        return (math.floor(lat / ALERT_GRID_SIZE), math.floor(lon / ALERT_GRID_SIZE))
+
+    def add_alert(self, cap_code: str, cap_data: dict):
+        alert = cap_data.get('alert', {})
+        info = alert.get('info', {})
+        if isinstance(info, list):
+            info = info[0]
+
+        alert_id = len(self.alerts)
+        self.alerts.append({
+            "headline": info.get('headline', '-'),
+            "event": info.get('event', '-'),
+            "effective": info.get('effective', '-'),
+            "expires": info.get('expires', '-'),
+            "severity": info.get('severity', '-'),
+            "certainty": info.get('certainty', '-'),
+            "urgency": info.get('urgency', '-'),
+            "web": info.get('web', '-'),
+            "cap_code": cap_code
+        })
+
+        areas = info.get('area', [])
+        if isinstance(areas, dict):
+            areas = [areas]
+
+        for area in areas:
+            polygons = area.get('polygon') or []
+            if isinstance(polygons, str):
+                polygons = [polygons]
+
+            for polygon in polygons:
+                try:
+                    points = parse_cap_polygon(polygon)
+                except ValueError:
+                    continue
+                if len(points) < 3:
+                    continue
+
+                lats = [p[0] for p in points]
+                lons = [p[1] for p in points]
+                bbox = (min(lats), min(lons), max(lats), max(lons))
+                polygon_id = len(self.polygons)
+                self.polygons.append((alert_id, area.get('areaDesc', '-'), bbox, points))
+
+                min_cell = self._cell(bbox[0], bbox[1])
+                max_cell = self._cell(bbox[2], bbox[3])
+                for cell_lat in range(min_cell[0], max_cell[0] + 1):
+                    for cell_lon in range(min_cell[1], max_cell[1] + 1):
+                        self.grid.setdefault((cell_lat, cell_lon), []).append(polygon_id)
+
+    def query(self, lat: float, lon: float) -> list[dict]:
+        """Peringatan aktif (belum expires) yang polygon areanya mencakup titik (lat, lon)"""
+        now = datetime.now(timezone.utc)
+        matches: dict[int, list[str]] = {}
+
+        for polygon_id in self.grid.get(self._cell(lat, lon), ()):
+            alert_id, area_desc, bbox, points = self.polygons[polygon_id]
+            if not (bbox[0] <= lat <= bbox[2] and bbox[1] <= lon <= bbox[3]):
+                continue
+            if point_in_polygon(lat, lon, points):
+                matches.setdefault(alert_id, []).append(area_desc)
+
+        results = []
+        for alert_id, area_descs in matches.items():
+            alert = self.alerts[alert_id]
+            try:
+                if datetime.fromisoformat(alert["expires"]) < now:
+                    continue
+            except (TypeError, ValueError):
+                pass
+            results.append({**alert, "affected_areas": area_descs})
+        return results
+
+_alert_indexes: dict[str, AlertIndex] = {}
+
+async def refresh_alert_index(language: str = "id") -> AlertIndex:
+    """Membangun ulang indeks spasial dari RSS nowcast dan dokumen CAP (memakai cache respons)"""
+    feed = await fetch_cached(f"https://www.bmkg.go.id/alerts/nowcast/{language}", parse_nowcast_xml, "nowcast")
+    cap_codes = get_cap_codes(feed)
+
+    index = AlertIndex(language)
+    for cap_code, cap_data in await fetch_cap_documents(cap_codes, language):
+        if not isinstance(cap_data, BaseException):
+            index.add_alert(cap_code, cap_data)
+
+    index.updated_at = datetime.now(timezone.utc)
+    _alert_indexes[language] = index
+    return index
+
+async def get_alert_index(language: str = "id") -> AlertIndex:
+    """Indeks peringatan yang dipelihara di background; dibangun saat itu juga bila belum ada atau usang"""
+    index = _alert_indexes.get(language)
+    max_age = max(ALERT_INDEX_INTERVAL, CACHE_TTLS["nowcast"]) * 2
+    if index is None or (datetime.now(timezone.utc) - index.updated_at).total_seconds() > max_age:
+        index = await refresh_alert_index(language)
+    return index
+
+async def maintain_alert_index():
+    """Job background: memperbarui indeks peringatan bahasa Indonesia secara berkala"""
+    await run_background_job("maintain_alert_index", ALERT_INDEX_INTERVAL, lambda: refresh_alert_index("id"))
+
+if ALERT_INDEX_INTERVAL > 0:
+    BACKGROUND_JOBS.append(maintain_alert_index)
+
+@mcp.tool()
+@instrumented
+async def get_alerts_for_location(
+    kode_wilayah: str = "",
+    lat: float | None = None,
+    lon: float | None = None,
+    language: str = "id"
+) -> str:
+    """
+    Mencari peringatan dini cuaca aktif yang polygon wilayahnya mencakup suatu lokasi.
+    Lebih akurat daripada pencocokan nama kecamatan karena memakai geometri area CAP.
+
+    Args:
+        kode_wilayah: Kode wilayah level desa/kelurahan (adm4), contoh: "31.74.09.1001".
+                      Koordinat diambil dari data lokasi prakiraan cuaca BMKG.
+        lat: Lintang lokasi (dipakai jika kode_wilayah kosong), contoh: -6.33
+        lon: Bujur lokasi (dipakai jika kode_wilayah kosong), contoh: 106.82
+        language: Bahasa output, "id" untuk Indonesia atau "en" untuk English (default: "id")
+
+    Returns:
+        Daftar peringatan aktif yang mencakup lokasi tersebut beserta area terdampak.
+    """
+    if language not in ["id", "en"]:
+        language = "id"
+
+    try:
+        if kode_wilayah:
+            coordinates = await get_region_coordinates(kode_wilayah)
+            if coordinates is None:
+                return dump_json({
+                    "error": f"Koordinat untuk kode wilayah '{kode_wilayah}' tidak ditemukan",
+                    "suggestion": "Gunakan kode level desa/kelurahan (4 segmen) atau isi lat/lon"
+                }, indent=2)
+            lat, lon = coordinates
+        elif lat is None or lon is None:
+            return dump_json({"error": "Isi kode_wilayah atau lat dan lon"}, indent=2)
+
+        index = await get_alert_index(language)
+        alerts = index.query(lat, lon)
+
+        result = {
+            "kode_wilayah": kode_wilayah or None,
+            "koordinat": f"{lat}, {lon}",
+            "index_updated": index.updated_at.isoformat(),
+            "total_matching_alerts": len(alerts),
+            "alerts": alerts
+        }
+        if not alerts:
+            result["message"] = "Tidak ada peringatan aktif yang mencakup lokasi ini"
+
+        return dump_json(result, indent=2)
+
+    except Exception as e:
+        return f"Gagal mencari peringatan untuk lokasi: {str(e)}"
+
+# ---------------------------------------------------------------------------
+# Poller feed dan log perubahan (gempa terbaru, gempa dirasakan, peringatan dini)
+# ---------------------------------------------------------------------------
+
+# Interval polling feed di background (detik); 0 = nonaktif, perubahan dihitung saat get_changes_since dipanggil
+FEED_POLL_INTERVAL = float(os.environ.get("BMKG_FEED_POLL_INTERVAL", "0"))
+# Jumlah event perubahan terakhir yang disimpan di memori
+CHANGE_LOG_SIZE = int(os.environ.get("BMKG_CHANGE_LOG_SIZE", "500"))
+# Kunci lease di cache bersama agar hanya satu worker yang membandingkan snapshot feed
+CHANGE_POLL_LEASE = "changes:poll"
+
+def snapshot_gempa(*text_fields: str):
+    """Snapshot feed gempa dengan DateTime sebagai kunci"""
+    def snapshot(records: list[GempaRecord]) -> dict[str, dict]:
+        return {
+            (gempa.datetime_utc if gempa.datetime_utc != "-" else f"{gempa.tanggal} {gempa.jam}"):
+                earthquake_to_dict(gempa, text_fields)
+            for gempa in records
+        }
+    return snapshot
+
+def snapshot_nowcast(feed: NowcastFeed) -> dict[str, dict]:
+    """Snapshot RSS nowcast dengan kode CAP sebagai kunci"""
+    return {
+        get_cap_code(item.link): {"title": item.title, "pub_date": item.pub_date, "link": item.link}
+        for item in feed.items if '_alert.xml' in item.link
+    }
+
+# Feed yang dipantau: nama -> (url, parser, fungsi snapshot, catat item yang hilang)
+POLLED_FEEDS = {
+    "autogempa": ("https://data.bmkg.go.id/DataMKG/TEWS/autogempa.xml", parse_gempa_xml, snapshot_gempa("potensi", "dirasakan"), False),
+    "gempaterkini": ("https://data.bmkg.go.id/DataMKG/TEWS/gempaterkini.xml", parse_gempa_xml, snapshot_gempa("potensi"), False),
+    "gempadirasakan": ("https://data.bmkg.go.id/DataMKG/TEWS/gempadirasakan.xml", parse_gempa_xml, snapshot_gempa("dirasakan"), False),
+    "nowcast": ("https://www.bmkg.go.id/alerts/nowcast/id", parse_nowcast_xml, snapshot_nowcast, True),
+}
+
+class ChangeLog:
+    """
+    Log perubahan feed BMKG dengan nomor urut (cursor) yang terus naik.
+
+    Setiap poll dibandingkan dengan snapshot sebelumnya per feed; item baru dicatat sebagai
+    "added" dan, untuk peringatan dini, item yang hilang dari RSS dicatat sebagai "removed".
+    Snapshot pertama tiap feed hanya menjadi baseline.
+
+    Dengan cache bersama (mode multi-worker), snapshot dan event disimpan di SQLite dengan satu
+    nomor urut global sehingga cursor berlaku di worker mana pun; memori worker hanya salinan
+    yang diperbarui lewat sync().
+    """
+
+    def __init__(self, max_events: int, store: SharedCache | None = None):
+        self.events: deque[dict] = deque(maxlen=max_events)
+        self.sequence = 0
+        self.snapshots: dict[str, dict[str, dict]] = {}
+        self.errors: dict[str, str] = {}
+        self.polled_at: datetime | None = None
+        self.store = store
+        self.lock = asyncio.Lock()
+
+    @staticmethod
+    def diff(previous: dict[str, dict], items: dict[str, dict], track_removed: bool) -> list[tuple]:
+        """Perubahan (change, key, data) dari snapshot sebelumnya ke snapshot baru"""
+        changes = [("added", key, data) for key, data in items.items() if key not in previous]
+        if track_removed:
+            changes += [("removed", key, data) for key, data in previous.items() if key not in items]
+        return changes
+
+    def record(self, feed: str, items: dict[str, dict], track_removed: bool) -> int:
+        """Membandingkan snapshot baru dengan sebelumnya; mengembalikan jumlah event yang dicatat"""
+        previous = self.snapshots.get(feed)
+        self.snapshots[feed] = items
+        if previous is None:
+            return 0
+
+        changes = self.diff(previous, items, track_removed)
+        detected_at = datetime.now(timezone.utc).isoformat()
+        for change, key, data in changes:
+            self.sequence += 1
+            self.events.append({
+                "cursor": self.sequence,
+                "feed": feed,
+                "change": change,
+                "key": key,
+                "detected_at": detected_at,
+                "data": data
+            })
+        return len(changes)
+
+    @staticmethod
+    async def fetch_feeds() -> list:
+        return await asyncio.gather(
+            *(fetch_cached(url, parse, name) for name, (url, parse, _, _) in POLLED_FEEDS.items()),
+            return_exceptions=True
+        )
+
+    async def poll(self):
+        """Mengambil semua feed yang dipantau (memakai cache respons) lalu mencatat perubahannya"""
+        async with self.lock:
+            if self.store is not None:
+                await self.poll_shared()
+                return
+            results = await self.fetch_feeds()
+            for name, result in zip(POLLED_FEEDS, results):
+                if isinstance(result, Exception):
+                    self.errors[name] = str(result)
+                    continue
+                self.errors.pop(name, None)
+                _, _, snapshot, track_removed = POLLED_FEEDS[name]
+                self.record(name, snapshot(result), track_removed)
+            self.polled_at = datetime.now(timezone.utc)
+
+    async def poll_shared(self):
+        """Poll dengan log di cache bersama; lease memastikan satu worker membandingkan snapshot"""
+        if not await asyncio.to_thread(self.store.acquire, CHANGE_POLL_LEASE, FETCH_DEADLINE * 2):
+            # Worker lain sedang mem-poll, cukup salin hasilnya
+            await self.sync()
+            return
         try:
-            response = await client.get(url_rss)
-            data = xmltodict.parse(response.content)
-
-            channel = data.get('rss', {}).get('channel', {})
-            items = channel.get('item', [])
-
-            if isinstance(items, dict):
-                items = [items]
-
-            if not items:
-                return json.dumps({"message": "Tidak ada peringatan aktif saat ini", "alerts": []}, indent=2)
-
-            matching_alerts = []
-
-            for item in items:
-                link = item.get('link', '')
-
-                if '_alert.xml' in link:
-                    cap_code = link.split('/')[-1].replace('_alert.xml', '')
-
-                    try:
-                        cap_url = f"https://www.bmkg.go.id/alerts/nowcast/{language}/{cap_code}_alert.xml"
-                        cap_response = await client.get(cap_url)
-                        cap_data = xmltodict.parse(cap_response.content)
-
-                        alert_detail = cap_data.get('alert', {})
-                        info = alert_detail.get('info', {})
-
-                        if isinstance(info, list):
-                            info = info[0]
-
-                        areas = info.get('area', [])
-                        if isinstance(areas, dict):
-                            areas = [areas]
-
-                        affected_areas = []
-                        kecamatan_found = False
-
-                        for area in areas:
-                            area_desc = area.get('areaDesc', '')
-
-                            if kecamatan.lower() in area_desc.lower():
-                                kecamatan_found = True
-                                affected_areas.append({
-                                    "area_desc": area_desc,
-                                    "polygon": area.get('polygon', '-')
-                                })
-
-                        if kecamatan_found:
-                            matching_alerts.append({
-                                "headline": info.get('headline', '-'),
-                                "event": info.get('event', '-'),
-                                "effective": info.get('effective', '-'),
-                                "expires": info.get('expires', '-'),
-                                "severity": info.get('severity', '-'),
-                                "certainty": info.get('certainty', '-'),
-                                "urgency": info.get('urgency', '-'),
-                                "description": info.get('description', '-'),
-                                "web": info.get('web', '-'),
-                                "affected_areas": affected_areas,
-                                "cap_code": cap_code
-                            })
-
-                    except Exception:
-                        continue
+            results = await self.fetch_feeds()
+            stored = await asyncio.to_thread(self.store.feed_snapshots)
+            now, offset = time.time(), monotonic_offset()
+            detected_at = datetime.now(timezone.utc).isoformat()
+            feeds, events = [], []
+            for name, result in zip(POLLED_FEEDS, results):
+                if isinstance(result, Exception):
+                    feeds.append((name, None, str(result), None, now))
+                    continue
+                url, _, snapshot, track_removed = POLLED_FEEDS[name]
+                entry = response_cache.entries.get(url)
+                fetched_at = entry.fetched_at - offset if entry is not None else now
+                previous, previous_fetched_at = stored.get(name, (None, None))
+                if previous_fetched_at is not None and fetched_at <= previous_fetched_at:
+                    # Cache lokal worker ini lebih lama dari snapshot tersimpan: jangan dibandingkan mundur
+                    feeds.append((name, None, None, None, now))
+                    continue
+                items = snapshot(result)
+                if previous is not None:
+                    events += [
+                        json.dumps({"feed": name, "change": change, "key": key, "detected_at": detected_at, "data": data})
+                        for change, key, data in self.diff(json.loads(previous), items, track_removed)
+                    ]
+                feeds.append((name, json.dumps(items), None, fetched_at, now))
+            await asyncio.to_thread(self.store.save_changes, feeds, events, self.events.maxlen)
+        finally:
+            await asyncio.to_thread(self.store.release, CHANGE_POLL_LEASE)
+        await self.sync()
+
+    async def sync(self):
+        """Menyalin event baru dan status feed dari cache bersama ke memori worker ini"""
+        rows, feeds = await asyncio.to_thread(self.store.changes_after, self.sequence)
+        for cursor, event in rows:
+            # sync() bisa berjalan bersamaan di worker yang sama; event yang sudah disalin dilewati
+            if cursor > self.sequence:
+                self.events.append({"cursor": cursor, **json.loads(event)})
+                self.sequence = cursor
+        self.errors = {feed: error for feed, error, _ in feeds if error}
+        polled_at = max((polled_at for _, _, polled_at in feeds), default=None)
+        self.polled_at = datetime.fromtimestamp(polled_at, timezone.utc) if polled_at is not None else None
+
+    def since(self, cursor: int, limit: int) -> tuple[list[dict], bool]:
+        """Event dengan cursor > `cursor` (maks. limit) dan apakah ada event yang sudah terbuang dari log"""
+        events = [event for event in self.events if event["cursor"] > cursor]
+        truncated = bool(self.events) and self.events[0]["cursor"] > cursor + 1 and cursor < self.sequence
+        return events[:limit], truncated
+
+change_log = ChangeLog(CHANGE_LOG_SIZE, shared_cache)
+
+async def get_change_log() -> ChangeLog:
+    """Log perubahan yang dipelihara di background; di-poll saat itu juga bila belum ada atau usang"""
+    if change_log.store is not None:
+        await change_log.sync()
+    max_age = FEED_POLL_INTERVAL * 2
+    if change_log.polled_at is None or (datetime.now(timezone.utc) - change_log.polled_at).total_seconds() > max_age:
+        await change_log.poll()
+    return change_log
+
+async def poll_feeds():
+    """Job background: memantau feed gempa dan peringatan dini secara berkala"""
+    await run_background_job("poll_feeds", FEED_POLL_INTERVAL, change_log.poll)
+
+if FEED_POLL_INTERVAL > 0:
+    BACKGROUND_JOBS.append(poll_feeds)
 
-            result = {
-                "kecamatan_searched": kecamatan,
-                "total_matching_alerts": len(matching_alerts),
-                "alerts": matching_alerts
-            }
+@mcp.tool()
+@instrumented
+async def get_changes_since(cursor: str = "", limit: int = 100) -> str:
+    """
+    Mengambil perubahan feed BMKG sejak cursor tertentu: gempa terbaru (autogempa), gempa
+    dirasakan, dan peringatan dini cuaca (RSS nowcast). Lebih hemat daripada memanggil ulang
+    get_latest_earthquake atau get_weather_alerts untuk mendeteksi perubahan.
 
-            if len(matching_alerts) == 0:
-                result["message"] = f"Tidak ada peringatan aktif untuk kecamatan '{kecamatan}'"
+    Args:
+        cursor: Nilai "next_cursor" dari panggilan sebelumnya. Kosongkan pada panggilan pertama
+                untuk mendapatkan semua perubahan yang masih tersimpan beserta cursor awal.
+        limit: Jumlah maksimal event per panggilan (default: 100)
 
-            return json.dumps(result, indent=2)
+    Returns:
+        Daftar event ("added" untuk gempa/peringatan baru, "removed" untuk peringatan yang
+        sudah tidak ada di RSS) dan next_cursor untuk panggilan berikutnya.
 
-        except Exception as e:
-            return f"Gagal mencari peringatan untuk kecamatan: {str(e)}"
+    Sumber Data: BMKG (Badan Meteorologi, Klimatologi, dan Geofisika)
+    """
+    try:
+        try:
+            after = int(cursor) if cursor.strip() else 0
+        except ValueError:
+            return dump_json({"error": f"Cursor tidak valid: '{cursor}'"}, indent=2)
+        limit = max(1, limit)
+
+        log = await get_change_log()
+        events, truncated = log.since(after, limit)
+        next_cursor = events[-1]["cursor"] if events else max(after, log.sequence)
+
+        result = {
+            "cursor": cursor,
+            "next_cursor": str(next_cursor),
+            "has_more": next_cursor < log.sequence,
+            "total": len(events),
+            "events": events,
+            "polled_at": log.polled_at.isoformat() if log.polled_at else None,
+            "sumber": BMKG_ATTRIBUTION
+        }
+        if truncated:
+            result["warning"] = "Sebagian event setelah cursor sudah terbuang dari log; ambil ulang data lengkap"
+        if log.errors:
+            result["feed_errors"] = log.errors
+        return dump_json(result, indent=2, ensure_ascii=False)
+
+    except Exception as e:
+        return f"Gagal mengambil perubahan feed: {str(e)}"
+
+@mcp.resource("bmkg://changes/latest", mime_type="application/json")
+async def get_latest_changes() -> str:
+    """Event perubahan feed BMKG yang masih tersimpan di log (gunakan get_changes_since untuk delta per cursor)"""
+    log = await get_change_log()
+    return dump_json({
+        "next_cursor": str(log.sequence),
+        "polled_at": log.polled_at.isoformat() if log.polled_at else None,
+        "events": list(log.events)
+    }, indent=2, ensure_ascii=False)
+
+# ---------------------------------------------------------------------------
+# Mode multi-worker untuk transport HTTP
+# ---------------------------------------------------------------------------
+
+def create_listen_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+async def run_worker(app, sock: socket.socket, metrics_sock: socket.socket | None):
+    """
+    Satu worker: uvicorn di atas socket bersama, dengan AsyncClient dan job background sepanjang umur proses.
+    Bila `metrics_sock` ada, GET /metrics worker ini dilayani pada socket tersebut.
+    """
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.routing import Route
+
+    log_level = mcp.settings.log_level.lower()
+    servers = [(uvicorn.Server(uvicorn.Config(app, log_level=log_level)), sock)]
+    if metrics_sock is not None:
+        metrics_app = Starlette(routes=[Route("/metrics", worker_metrics_endpoint, methods=["GET"])])
+        servers.append((uvicorn.Server(uvicorn.Config(metrics_app, log_level=log_level)), metrics_sock))
+    # Mode stateless menjalankan lifespan FastMCP per request; dipegang di sini agar tidak ditutup tiap request
+    async with lifespan(mcp):
+        await asyncio.gather(*(server.serve(sockets=[listen_sock]) for server, listen_sock in servers))
+
+def serve_workers(host: str, port: int, workers: int, metrics_port: int = 0):
+    """
+    Menjalankan transport streamable-HTTP dengan beberapa proses worker pada satu port (pre-fork).
+
+    Sesi MCP disimpan di memori worker, sehingga mode ini memakai stateless HTTP: setiap request
+    dapat dilayani worker mana pun. Indeks wilayah dimuat sebelum fork sehingga dibangun sekali
+    dan halamannya dibagi (copy-on-write) oleh semua worker. Respons BMKG dibagi lewat cache
+    bersama SQLite (BMKG_SHARED_CACHE_PATH), jadi setiap URL diambil sekali per host, bukan per worker;
+    job background juga hanya dijalankan satu worker per interval (claim_job).
+
+    Metrics tetap per worker: bila `metrics_port` diisi, worker ke-i melayani /metrics pada port
+    metrics_port + i; /metrics pada port utama ditolak.
+    """
+    global worker_metrics_ports
+    mcp.settings.stateless_http = True
+    app = mcp.streamable_http_app()
+    get_region_index()
+    sock = create_listen_socket(host, port)
+    worker_metrics_ports = range(metrics_port, metrics_port + workers) if metrics_port else range(0)
+    metrics_socks = [create_listen_socket(host, p) for p in worker_metrics_ports] or [None] * workers
+    print(f"BMKG MCP server di http://{host}:{port}{mcp.settings.streamable_http_path} dengan {workers} worker", file=sys.stderr)
+    if metrics_port:
+        print(f"Metrics per worker di http://{host}:{metrics_port}-{metrics_port + workers - 1}/metrics", file=sys.stderr)
+
+    children = []
+    for metrics_sock in metrics_socks:
+        pid = os.fork()
+        if pid == 0:
+            for other in metrics_socks:
+                if other is not None and other is not metrics_sock:
+                    other.close()
+            asyncio.run(run_worker(app, sock, metrics_sock))
+            os._exit(0)
+        children.append(pid)
+    sock.close()
+    for metrics_sock in metrics_socks:
+        if metrics_sock is not None:
+            metrics_sock.close()
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    # Ctrl+C dari terminal sudah diterima langsung oleh semua worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for pid in children:
+        while True:
+            try:
+                os.waitpid(pid, 0)
+                break
+            except InterruptedError:
+                continue
+            except ChildProcessError:
+                break
+
+def serve(argv: list[str]):
+    """python bmkg-server.py serve [--transport stdio|sse|streamable-http] [--host H] [--port P] [--workers N] [--metrics-port M]"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="bmkg-server.py serve", description="Menjalankan server MCP BMKG")
+    parser.add_argument("--transport", choices=("stdio", "sse", "streamable-http"), default="stdio")
+    parser.add_argument("--host", default=mcp.settings.host)
+    parser.add_argument("--port", type=int, default=mcp.settings.port)
+    parser.add_argument("--workers", type=int, default=1, help="Jumlah proses worker (hanya streamable-http)")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="Port awal /metrics per worker pada mode multi-worker (worker ke-i di port + i)")
+    args = parser.parse_args(argv)
+
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    if args.workers <= 1:
+        mcp.run(transport=args.transport)
+    elif args.transport != "streamable-http":
+        parser.error("--workers > 1 hanya didukung untuk --transport streamable-http")
+    elif not hasattr(os, "fork"):
+        parser.error("--workers > 1 membutuhkan os.fork (Linux/macOS)")
+    else:
+        if shared_cache is None:
+            print("Peringatan: BMKG_SHARED_CACHE_PATH kosong, setiap worker mengambil data BMKG sendiri", file=sys.stderr)
+        serve_workers(args.host, args.port, args.workers, args.metrics_port)
 
 if __name__ == "__main__":
-    mcp.run()
\ No newline at end of file
+    if sys.argv[1:2] == ["build-index"]:
+        # Kompilasi base.csv menjadi snapshot biner: python bmkg-server.py build-index
+        index = build_region_snapshot(CSV_PATH, SNAPSHOT_PATH)
+        print(f"Snapshot {SNAPSHOT_PATH} dibuat: {len(index)} wilayah")
+    elif sys.argv[1:2] == ["import-centroids"] and len(sys.argv) == 3:
+        # Gabungkan file centroid (kode,lat,lon) ke centroids.csv: python bmkg-server.py import-centroids <file>
+        names = get_region_index().names
+        rows = [row for row in CentroidIndex.read_csv(sys.argv[2]) if row[0] in names]
+        for code, lat, lon in rows:
+            centroid_index.add(code, lat, lon, persist=False)
+        centroid_index.save()
+        print(f"{len(rows)} centroid diimpor ke {CENTROIDS_PATH} (total {len(centroid_index.coordinates)})")
+    elif sys.argv[1:2] == ["serve"]:
+        # Transport HTTP, opsional multi-worker: python bmkg-server.py serve --transport streamable-http --workers 4
+        serve(sys.argv[2:])
+    else:
+        mcp.run()
\ No newline at end of file